@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Group, Event, UserProfile, Member, Comment, Bet
+from .models import Group, Event, UserProfile, Member, Comment, Bet, Standing
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -8,7 +8,7 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
-    fields = ('name','location', 'description')
+    fields = ('name','location', 'description', 'scoring')
     list_display = ('id','name', 'location', 'description')
 
 @admin.register(Event)
@@ -29,4 +29,9 @@ class CommentAdmin(admin.ModelAdmin):
 @admin.register(Bet)
 class BetAdmin(admin.ModelAdmin):
     fields = ('user', 'event','score1', 'score2')
-    list_display = ('user', 'event','score1', 'score2')
\ No newline at end of file
+    list_display = ('user', 'event','score1', 'score2')
+
+@admin.register(Standing)
+class StandingAdmin(admin.ModelAdmin):
+    fields = ('group', 'user', 'points', 'exact_hits', 'outcome_hits')
+    list_display = ('group', 'user', 'points', 'exact_hits', 'outcome_hits')
\ No newline at end of file
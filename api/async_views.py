@@ -0,0 +1,187 @@
+"""
+Async versions of the hot read endpoints, built on Django's async ORM and
+the plain-dict payloads of api/payloads.py. Each one is switched on in
+settings.API_ASYNC_VIEWS and then takes the GET requests of its route,
+other methods still go to the DRF viewset. Under WSGI they run through
+async_to_sync, so only enable them for the ASGI deployment (bwf/asgi.py).
+
+The lists page with the cursors of api/pagination.py, so links from either
+side work on the other; reversed cursors (previous links) are handed to
+the viewset. ?fields= and ?expand= prune the payloads as in the viewsets.
+The detail views skip the response cache of api/cache.py and send no
+ETag: its client is synchronous and would hold a thread per request,
+which is what these views are there to avoid.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.urls import path
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.utils import encoders
+
+from api import payloads, sparse, views
+from api.authentication import aauthenticate
+from api.models import Group, Event, Member, Comment, Bet, Standing
+from api.pagination import CommentPagination, CursorPagination
+
+
+def json_response(data, status=200, headers=None):
+    return JsonResponse(data, encoder=encoders.JSONEncoder, safe=False, status=status, headers=headers)
+
+
+def not_found(model):
+    return json_response({"detail": "No {} matches the given query.".format(model.__name__)}, status=404)
+
+
+def int_param(request, name):
+    try:
+        value = int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def backwards(request):
+    """Whether ?cursor= is a reversed one, those are only paged by the viewsets."""
+    try:
+        cursor = CursorPagination().decode_cursor(Request(request))
+    except exceptions.NotFound:
+        return False
+    return cursor is not None and cursor.reverse
+
+
+async def group_list(request, user):
+    request = Request(request)
+    paginator = CursorPagination()
+    queryset = (
+        Group.objects.annotate(members_total=Count("members"))
+        .values(*payloads.GROUP_VALUES, "members_total")
+    )
+    rows = await paginator.apaginate_queryset(queryset, request)
+    params = sparse.parse(request.query_params)
+    return json_response({
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": [sparse.prune(payloads.group(row), **params) for row in rows],
+    })
+
+
+async def group_detail(request, user, pk):
+    try:
+        group = await Group.objects.values(*payloads.GROUP_VALUES).aget(pk=pk)
+    except Group.DoesNotExist:
+        return not_found(Group)
+
+    events = Event.objects.filter(group=pk).order_by("id").values(*payloads.EVENT_VALUES)
+    standing = Standing.objects.filter(group=pk, user=OuterRef("user"))
+    members = (
+        Member.objects.filter(group=pk)
+        .annotate(points=Coalesce(Subquery(standing.values("points")[:1]), 0))
+        .order_by("-points", "id")
+        .values(*payloads.MEMBER_VALUES)
+    )
+    offset = int_param(request, "offset") or 0
+    limit = int_param(request, "limit")
+    members = members[offset:] if limit is None else members[offset:offset + limit]
+    comments = Comment.objects.filter(group=pk).order_by("-time").values(*payloads.COMMENT_VALUES)
+
+    return json_response(sparse.prune(dict(
+        group,
+        events=[payloads.event(row) async for row in events.aiterator()],
+        members=[payloads.member(row) async for row in members.aiterator()],
+        comments=[payloads.comment(row) async for row in comments.aiterator()],
+    ), **sparse.parse(request.GET)))
+
+
+async def event_detail(request, user, pk):
+    admin_flag = Member.objects.filter(group=OuterRef("group"), user=user)
+    try:
+        event = await (
+            Event.objects.annotate(
+                num_bets=Count("bets"),
+                is_admin=Subquery(admin_flag.values("admin")[:1]),
+            )
+            .values(*payloads.EVENT_FULL_VALUES, "num_bets", "is_admin")
+            .aget(pk=pk)
+        )
+    except Event.DoesNotExist:
+        return not_found(Event)
+
+    bets = Bet.objects.filter(event=pk)
+    if event["time"] >= timezone.now():
+        bets = bets.filter(user=user)
+    bets = bets.order_by("id").values(*payloads.BET_VALUES)
+
+    return json_response(sparse.prune(payloads.event_full(
+        event,
+        bets=[payloads.bet(row, request) async for row in bets.aiterator()],
+        is_admin=event["is_admin"],
+        num_bets=event["num_bets"],
+    ), **sparse.parse(request.GET)))
+
+
+async def comment_list(request, user):
+    request = Request(request)
+    paginator = CommentPagination()
+    queryset = Comment.objects.values(*payloads.COMMENT_VALUES)
+    rows = await paginator.apaginate_queryset(queryset, request)
+    params = sparse.parse(request.query_params)
+    return json_response({
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": [sparse.prune(payloads.comment(row), **params) for row in rows],
+    })
+
+
+def endpoint(get, fallback, login_required):
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method != "GET" or backwards(request):
+            return await sync_to_async(fallback)(request, *args, **kwargs)
+        try:
+            user = await aauthenticate(request)
+        except exceptions.AuthenticationFailed as exc:
+            return json_response({"detail": exc.detail}, status=401, headers={"WWW-Authenticate": "Token"})
+        if login_required and not user.is_authenticated:
+            detail = exceptions.NotAuthenticated.default_detail
+            return json_response({"detail": detail}, status=401, headers={"WWW-Authenticate": "Token"})
+        try:
+            return await get(request, user, *args, **kwargs)
+        except exceptions.NotFound as exc:
+            return json_response({"detail": exc.detail}, status=404)
+
+    return view
+
+
+DETAIL_ACTIONS = {"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}
+
+ENDPOINTS = {
+    "group-list": (
+        "groups/", group_list,
+        views.GroupViewSet.as_view({"get": "list", "post": "create"}), False,
+    ),
+    "group-detail": (
+        "groups/<int:pk>/", group_detail,
+        views.GroupViewSet.as_view(DETAIL_ACTIONS), False,
+    ),
+    "event-detail": (
+        "events/<int:pk>/", event_detail,
+        views.EventViewSet.as_view(DETAIL_ACTIONS), True,
+    ),
+    "comment-list": (
+        "comments/", comment_list,
+        views.CommentViewSet.as_view({"get": "list", "post": "create"}), True,
+    ),
+}
+
+
+def urlpatterns(enabled):
+    return [
+        path(route, endpoint(get, fallback, login_required), name=name)
+        for name, (route, get, fallback, login_required) in ENDPOINTS.items()
+        if enabled.get(name)
+    ]
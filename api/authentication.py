@@ -0,0 +1,219 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api import cache as response_cache
+
+
+class TokenCache:
+    """
+    Bounded LRU of token key -> (user, token), entries expire after ttl
+    seconds. Each entry keeps the shared version of its token (see
+    token_version()) and is only used while that version is current.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_version, value = entry
+            if expires < time.monotonic() or entry_version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (_, _, (user, _)) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.API_TOKEN_CACHE_SIZE, settings.API_TOKEN_CACHE_TTL)
+
+
+def _token_id(key):
+    # token keys are credentials, the shared cache only sees a digest
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def token_version(key):
+    """
+    Version of a token in the shared API_CACHE_ALIAS cache, bumped by
+    revoke_token() when the token or its user changes. Versions expire with
+    the local entries, so unknown keys do not pile up in the cache.
+    """
+    return response_cache.get_version("token", _token_id(key), settings.API_TOKEN_CACHE_TTL)
+
+
+def revoke_token(key):
+    """Drops a token from the cache of every process, once the transaction commits."""
+    response_cache.invalidate_on_commit("token", _token_id(key), settings.API_TOKEN_CACHE_TTL)
+    transaction.on_commit(lambda: token_cache.discard(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers resolved tokens in process memory.
+    A local entry is trusted only while the shared version of its token is
+    unchanged, which costs one cache read instead of a database query. The
+    version is read before the database, so a request racing a revoke
+    caches the old row under the old version.
+    """
+
+    def authenticate_credentials(self, key):
+        version = token_version(key)
+        cached = token_cache.get(key, version)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, version, cached)
+        user, token = cached
+        # every request gets its own copy, views may modify request.user
+        return copy.copy(user), token
+
+
+async def aauthenticate(request):
+    """
+    Token authentication for plain async Django views. Returns the user,
+    AnonymousUser without credentials, raises AuthenticationFailed for a
+    bad token.
+    """
+    header = request.headers.get("Authorization", "").split()
+    if len(header) != 2 or header[0] != "Token":
+        return AnonymousUser()
+
+    backend = CachedTokenAuthentication()
+    user, _ = await sync_to_async(backend.authenticate_credentials)(header[1])
+    return user
+
+
+class PasswordVerifier:
+    """
+    Runs password checks on a bounded thread pool, so a login storm keeps at
+    most `workers` cores hashing. Beyond `max_pending` waiting checks logins
+    are refused with 429 instead of queueing without limit.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._reserved = threading.local()
+
+    def get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="login")
+            return self._pool
+
+    @contextmanager
+    def reserve(self):
+        """
+        Takes a slot for the verify() calls of this thread, so a view can
+        answer 429 when there is none instead of failing the login. Yields
+        False without a free slot.
+        """
+        if not self._slots.acquire(blocking=False):
+            yield False
+            return
+        self._reserved.active = True
+        try:
+            yield True
+        finally:
+            self._reserved.active = False
+            self._slots.release()
+
+    def verify(self, password, encoded):
+        """
+        Returns (valid, upgraded): upgraded is the password rehashed with the
+        current hasher settings if the stored hash is outdated, else None.
+        Without a stored hash (no such user) a hash is still computed, so the
+        response time does not tell whether the username exists. Raises
+        PermissionDenied when all slots are taken, authenticate() then
+        refuses the login.
+        """
+        if getattr(self._reserved, "active", False):
+            return self.get_pool().submit(self._verify, password, encoded).result()
+        if not self._slots.acquire(blocking=False):
+            raise PermissionDenied("Too many logins in progress")
+        try:
+            return self.get_pool().submit(self._verify, password, encoded).result()
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _verify(password, encoded):
+        if encoded is None:
+            make_password(password)
+            return False, None
+        upgraded = []
+        valid = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+        return valid, upgraded[0] if upgraded else None
+
+
+password_verifier = PasswordVerifier(settings.API_LOGIN_WORKERS, settings.API_LOGIN_MAX_PENDING)
+
+
+class PasswordVerifierBackend(ModelBackend):
+    """
+    ModelBackend whose password check runs on password_verifier. The user
+    is loaded with profile and token, so the login view needs no further
+    query, and an outdated hash is upgraded unless the password was
+    changed meanwhile.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        User = get_user_model()
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = (
+            User._default_manager.select_related("profile", "auth_token")
+            .filter(**{User.USERNAME_FIELD: username})
+            .first()
+        )
+        valid, upgraded = password_verifier.verify(password, user.password if user is not None else None)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if upgraded:
+            User._default_manager.filter(pk=user.pk, password=user.password).update(password=upgraded)
+            user.password = upgraded
+        return user
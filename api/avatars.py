@@ -0,0 +1,129 @@
+"""
+Avatar variants: an uploaded UserProfile.image is copied without its
+metadata and resized to square copies of settings.API_AVATAR_SIZES next
+to it, then the profile is pointed at the copy. The work runs on a
+background thread pool once the upload has committed (api/signals.py),
+existing avatars are processed by the build_avatars command.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, size):
+    return "{}-{}.{}".format(posixpath.splitext(name)[0], size, settings.API_AVATAR_FORMAT.lower())
+
+
+def _encode(image, image_format, **params):
+    if image_format in ("JPEG", "MPO"):
+        image_format = "JPEG"
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, image_format, **params)
+    return output.getvalue()
+
+
+def _save(name, data):
+    # never overwrites, the storage picks a free name next to the wanted one
+    return default_storage.save(name, ContentFile(data))
+
+
+def build_variants(name):
+    """
+    Saves a copy of the stored original without metadata and its variants,
+    all under new names, the original stays until save_variants() has
+    switched the profile over. Only touches the storage, so it also runs in
+    a worker process. Returns the new image_variants value of the profile.
+    """
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image_format = image.format
+        image.load()
+
+    # apply the EXIF orientation before the EXIF block is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    image.info = {}
+
+    source = _save(name, _encode(image, image_format))
+    variants = {"source": source}
+    for size in settings.API_AVATAR_SIZES:
+        resized = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        data = _encode(resized, settings.API_AVATAR_FORMAT, quality=settings.API_AVATAR_QUALITY)
+        variants[str(size)] = _save(variant_name(source, size), data)
+    return variants
+
+
+def try_build_variants(name):
+    try:
+        return build_variants(name)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception("avatar %s could not be processed", name)
+        return None
+
+
+def save_variants(profile_id, name, variants, previous):
+    """
+    Points the profile at the new files unless its image was replaced
+    meanwhile, then deletes the files it no longer uses: the original
+    upload and the previous variants, or the new files if it was replaced.
+    """
+    from api import cache
+    from api.models import UserProfile
+
+    updated = UserProfile.objects.filter(pk=profile_id, image=name).update(
+        image=variants["source"], image_variants=variants
+    )
+    if updated:
+        # update() sends no post_save
+        cache.invalidate_user_on_commit(UserProfile.objects.values_list("user_id", flat=True).get(pk=profile_id))
+        stale = {name, *previous.values()} - set(variants.values())
+    else:
+        stale = set(variants.values())
+    for file_name in stale:
+        default_storage.delete(file_name)
+    return bool(updated)
+
+
+def process_avatar(profile_id, name, previous):
+    try:
+        variants = try_build_variants(name)
+        if variants is not None:
+            save_variants(profile_id, name, variants, previous)
+    finally:
+        # worker threads keep their own connections
+        if settings.API_AVATAR_WORKERS:
+            connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.API_AVATAR_WORKERS, thread_name_prefix="avatars"
+            )
+        return _executor
+
+
+def schedule(profile):
+    """Builds the variants of profile.image after the current transaction commits."""
+    args = (profile.pk, profile.image.name, dict(profile.image_variants))
+    if settings.API_AVATAR_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(process_avatar, *args))
+    else:
+        transaction.on_commit(lambda: process_avatar(*args))
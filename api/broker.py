@@ -0,0 +1,80 @@
+"""
+In-process fan-out of live group messages to the open SSE streams
+(api/streams.py). Writers call publish() from any thread; each message is
+encoded once and handed to every event loop with subscribers in a single
+call, without touching the database.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.utils import encoders
+
+
+class Subscription:
+    def __init__(self, group_id, loop, maxsize):
+        self.group_id = group_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, message):
+        # slow clients lose their oldest messages rather than grow the queue
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class Broker:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        # group id -> event loop -> subscriptions
+        self._subscriptions = defaultdict(lambda: defaultdict(set))
+        self._lock = threading.Lock()
+
+    def subscribe(self, group_id):
+        subscription = Subscription(group_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions[group_id][subscription.loop].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            loops = self._subscriptions.get(subscription.group_id)
+            if loops is None:
+                return
+            subscriptions = loops.get(subscription.loop)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del loops[subscription.loop]
+            if not loops:
+                del self._subscriptions[subscription.group_id]
+
+    def publish(self, group_id, event, data):
+        with self._lock:
+            loops = self._subscriptions.get(group_id)
+            if not loops:
+                return
+            targets = [(loop, list(subscriptions)) for loop, subscriptions in loops.items()]
+
+        message = "event: {}\ndata: {}\n\n".format(event, json.dumps(data, cls=encoders.JSONEncoder)).encode()
+        for loop, subscriptions in targets:
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, message)
+            except RuntimeError:
+                # loop already closed, its subscriptions are going away
+                pass
+
+    def publish_on_commit(self, group_id, event, data):
+        transaction.on_commit(lambda: self.publish(group_id, event, data))
+
+
+def _deliver(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.push(message)
+
+
+broker = Broker(settings.API_STREAM_QUEUE_SIZE)
@@ -0,0 +1,200 @@
+"""
+Response cache for the group and event detail endpoints.
+
+Every group and event has a version stored in the cache. Cached payloads
+and ETags are keyed by those versions, so invalidating is a matter of
+bumping a version (see api/signals.py) and stale entries simply expire.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from api.models import Bet, Comment, Event, Group, Member
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def _version_key(kind, pk):
+    return "bwf:version:{}:{}".format(kind, pk)
+
+
+def get_version(kind, pk, timeout=None):
+    # a version that expired comes back as a new one, so whatever was
+    # stored under the old one is never served again
+    return get_cache().get_or_set(_version_key(kind, pk), time.time_ns, timeout=timeout)
+
+
+def _existing_version(model, kind, pk):
+    """get_version() for a row that exists, None without storing a version otherwise."""
+    version = get_cache().get(_version_key(kind, pk))
+    if version is not None:
+        return version
+    try:
+        exists = model.objects.filter(pk=pk).exists()
+    except (TypeError, ValueError):
+        exists = False
+    return get_version(kind, pk) if exists else None
+
+
+def invalidate(kind, pk, timeout=None):
+    get_cache().set(_version_key(kind, pk), time.time_ns(), timeout=timeout)
+
+
+def invalidate_on_commit(kind, pk, timeout=None):
+    # a reader racing the write transaction could otherwise cache the
+    # old data under the new version
+    transaction.on_commit(lambda: invalidate(kind, pk, timeout))
+
+
+def invalidate_user_on_commit(user_id):
+    """
+    Bumps the groups and events whose details show the user: members and
+    comments of a group, bets of an event. They are looked up after the
+    commit, rows deleted with the user invalidate through their own signals.
+    """
+    transaction.on_commit(lambda: _invalidate_user(user_id))
+
+
+def _invalidate_user(user_id):
+    group_ids = set(Member.objects.filter(user=user_id).values_list("group_id", flat=True))
+    group_ids.update(Comment.objects.filter(user=user_id).values_list("group_id", flat=True).distinct())
+    event_ids = Bet.objects.filter(user=user_id).values_list("event_id", flat=True)
+    version = time.time_ns()
+    versions = {_version_key("group", pk): version for pk in group_ids}
+    versions.update((_version_key("event", pk), version) for pk in event_ids)
+    get_cache().set_many(versions, timeout=None)
+
+
+def _count(name):
+    cache = get_cache()
+    key = "bwf:stats:{}".format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def stats():
+    cache = get_cache()
+    return {
+        "hits": cache.get("bwf:stats:hits", 0),
+        "misses": cache.get("bwf:stats:misses", 0),
+    }
+
+
+def get_many(keys):
+    """Returns the cached values of all keys, or None if any of them is missing."""
+    values = get_cache().get_many(keys)
+    if len(values) == len(keys):
+        _count("hits")
+        return [values[key] for key in keys]
+    _count("misses")
+    return None
+
+
+def set_many(data):
+    get_cache().set_many(data, timeout=settings.API_CACHE_TIMEOUT)
+
+
+def make_key(*parts):
+    return "bwf:response:" + hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return "*" in etags or etag in etags
+
+
+def group_detail(request, pk, build):
+    """
+    Cached GroupFullSerializer payload, build() is only called on a miss.
+    Returns (etag, data), data is None when the client copy is still fresh.
+    """
+    query = request.query_params.urlencode()
+    version = _existing_version(Group, "group", pk)
+    if version is None:
+        # raises Http404, unless the group was created meanwhile
+        build()
+        version = get_version("group", pk)
+    etag = make_etag("group", pk, version, query)
+    if not_modified(request, etag):
+        return etag, None
+
+    key = make_key("group", pk, version, query)
+    cached = get_many([key])
+    if cached is not None:
+        return etag, cached[0]
+
+    data = build()
+    set_many({key: data})
+    return etag, data
+
+
+def event_detail(request, pk, build, fields):
+    """
+    Cached EventFullSerializer payload. The shared part (event fields, bet
+    count, everyone's bets after kickoff) is stored once per event, the
+    per-user part (admin flag, own bets before kickoff) once per user.
+    Both are stored unpruned, the ETag varies with the query string like
+    that of group_detail(). build() returns the event instance and its
+    serialized data.
+    """
+    query = request.query_params.urlencode()
+    event_version = _existing_version(Event, "event", pk)
+    if event_version is None:
+        build()
+        event_version = get_version("event", pk)
+    shared_key = make_key("event", pk, event_version)
+
+    shared = get_cache().get(shared_key)
+    if shared is not None:
+        started = shared["kickoff"] < timezone.now()
+        if started and shared["bets"] is None:
+            # cached before kickoff, bets are public now
+            shared = None
+
+    if shared is not None:
+        group_version = get_version("group", shared["data"]["group"])
+        etag = make_etag("event", pk, event_version, group_version, request.user.pk, started, query)
+        if not_modified(request, etag):
+            return etag, None
+        user_key = make_key("event-user", pk, event_version, group_version, request.user.pk, started)
+        cached = get_many([user_key])
+        if cached is not None:
+            return etag, _join_event(fields, shared, cached[0])
+    else:
+        _count("misses")
+
+    instance, data = build()
+    data = dict(data)
+    bets = data.pop("bets")
+    is_admin = data.pop("is_admin")
+    started = instance.time < timezone.now()
+    shared = {"kickoff": instance.time, "data": data, "bets": bets if started else None}
+    user_part = {"is_admin": is_admin, "bets": None if started else bets}
+    group_version = get_version("group", instance.group_id)
+    user_key = make_key("event-user", pk, event_version, group_version, request.user.pk, started)
+    set_many({shared_key: shared, user_key: user_part})
+
+    etag = make_etag("event", pk, event_version, group_version, request.user.pk, started, query)
+    return etag, _join_event(fields, shared, user_part)
+
+
+def _join_event(fields, shared, user_part):
+    data = dict(shared["data"], is_admin=user_part["is_admin"])
+    data["bets"] = shared["bets"] if shared["bets"] is not None else user_part["bets"]
+    return {name: data[name] for name in fields}
@@ -0,0 +1,57 @@
+"""
+Production SQLite profile (settings.SQLITE_PRODUCTION): pragmas applied to
+every new connection and a router sending reads of the api models to the
+read-only replica connections.
+"""
+import random
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not settings.SQLITE_PRODUCTION:
+        return
+    read_only = "mode=ro" in str(connection.settings_dict["NAME"])
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            # the journal mode is stored in the database file, readers inherit it
+            if read_only and name == "journal_mode":
+                continue
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+
+
+class ReadReplicaRouter:
+    """Reads of api models go to a random replica, everything else to default."""
+
+    app_label = "api"
+
+    def replicas(self):
+        return settings.SQLITE_READ_REPLICAS
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not self.replicas():
+            return None
+        # stay on the connection an instance came from, and read your own
+        # writes while a transaction is open
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if connections["default"].in_atomic_block:
+            return "default"
+        return random.choice(self.replicas())
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *self.replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
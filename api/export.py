@@ -0,0 +1,126 @@
+"""
+Streaming export of a group's events with their results and bets, one
+row per bet (events nobody bet on get one row with empty bet columns).
+Rows come from values_list().iterator(), are encoded as CSV or NDJSON and
+optionally gzipped on the fly, so memory stays flat for any group size.
+Bets are only exported once their event has started, like everywhere else
+in the API, unless upcoming_bets is set (staff).
+"""
+import csv
+import json
+import zlib
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from api.models import Event
+from api.payloads import format_datetime
+
+COLUMNS = (
+    ("event", "id"),
+    ("team1", "team1"),
+    ("team2", "team2"),
+    ("time", "time"),
+    ("result1", "score1"),
+    ("result2", "score2"),
+    ("user", "bets__user"),
+    ("username", "bets__user__username"),
+    ("score1", "bets__score1"),
+    ("score2", "bets__score2"),
+    ("points", "bets__points"),
+    ("placed_at", "bets__placed_at"),
+)
+DATETIME_COLUMNS = {"time", "placed_at"}
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+TIME_COLUMN = [name for name, _ in COLUMNS].index("time")
+# the bet columns come last
+BET_COLUMNS = len([field for _, field in COLUMNS if field.startswith("bets__")])
+# spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# encoded bytes collected before a chunk is sent (and compressed)
+BUFFER_SIZE = 64 * 1024
+
+
+def rows(group, upcoming_bets=False):
+    datetimes = [index for index, (name, _) in enumerate(COLUMNS) if name in DATETIME_COLUMNS]
+    queryset = (
+        Event.objects.filter(group=group)
+        .order_by("time", "id", "bets__id")
+        .values_list(*(field for _, field in COLUMNS))
+    )
+    now = timezone.now()
+    previous = None
+    for row in queryset.iterator(chunk_size=settings.API_EXPORT_CHUNK_SIZE):
+        if not upcoming_bets and row[TIME_COLUMN] >= now:
+            # one row without bets for an event that has not started
+            if row[0] == previous:
+                continue
+            previous = row[0]
+            row = row[:-BET_COLUMNS] + (None,) * BET_COLUMNS
+        row = list(row)
+        for index in datetimes:
+            if row[index] is not None:
+                row[index] = format_datetime(row[index])
+        yield row
+
+
+class _Line:
+    """File-like target for csv.writer that hands back the written line."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(group, upcoming_bets=False):
+    writer = csv.writer(_Line())
+    yield writer.writerow([name for name, _ in COLUMNS])
+    for row in rows(group, upcoming_bets):
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def ndjson_lines(group, upcoming_bets=False):
+    names = [name for name, _ in COLUMNS]
+    for row in rows(group, upcoming_bets):
+        yield json.dumps(dict(zip(names, row))) + "\n"
+
+
+def chunks(lines, gzip):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def response(group, export_format, gzip=False, upcoming_bets=False):
+    lines = (csv_lines if export_format == "csv" else ndjson_lines)(group, upcoming_bets)
+    filename = "group-{}.{}".format(group.pk, export_format) + (".gz" if gzip else "")
+    response = StreamingHttpResponse(
+        chunks(lines, gzip),
+        content_type="application/gzip" if gzip else FORMATS[export_format],
+    )
+    response["Content-Disposition"] = 'attachment; filename="{}"'.format(filename)
+    response["Cache-Control"] = "no-store"
+    return response
@@ -0,0 +1,35 @@
+"""
+The global leaderboard is a snapshot (LeaderboardEntry) rebuilt from the
+group standings with RANK() and ROW_NUMBER() windows in one INSERT ...
+SELECT. Reads then only touch the snapshot's indexes: a user's entry by
+user_id, a page of it by position.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import LeaderboardEntry, Standing
+
+REFRESH_SQL = """
+INSERT INTO {entry} (user_id, points, {rank}, {position}, refreshed_at)
+SELECT user_id, points,
+       RANK() OVER (ORDER BY points DESC),
+       ROW_NUMBER() OVER (ORDER BY points DESC, user_id),
+       %s
+FROM (SELECT user_id, SUM(points) AS points FROM {standing} GROUP BY user_id) AS totals
+"""
+
+
+def refresh():
+    """Replaces the snapshot with the current per-user totals over all groups, returns its size."""
+    quote = connection.ops.quote_name
+    sql = REFRESH_SQL.format(
+        entry=quote(LeaderboardEntry._meta.db_table),
+        standing=quote(Standing._meta.db_table),
+        rank=quote("rank"),
+        position=quote("position"),
+    )
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now()])
+            return cursor.rowcount
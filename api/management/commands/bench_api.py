@@ -0,0 +1,136 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import UserProfile, Group, Event, Member, Comment, Bet
+from api.urls import router
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the GET endpoints of the API router through the test client "
+        "against data of seed_bwf and prints p50/p95 latency, SQL queries and "
+        "response bytes per endpoint as JSON, for diffing between commits. "
+        "The response cache is bypassed unless --cache is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20, help="Measured requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--prefix", default="seed", help="Prefix that seed_bwf was run with")
+        parser.add_argument("--cache", action="store_true", help="Keep the configured response cache")
+        parser.add_argument("--output", help="Write the JSON to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("--requests must be at least 2")
+        targets = self.targets(options["prefix"])
+        headers = {"Authorization": "Token " + Token.objects.get_or_create(user=targets["user"])[0].key}
+
+        overrides = {"ALLOWED_HOSTS": ["testserver"]}
+        if not options["cache"]:
+            overrides["CACHES"] = dict(settings.CACHES, bench={"BACKEND": "django.core.cache.backends.dummy.DummyCache"})
+            overrides["API_CACHE_ALIAS"] = "bench"
+
+        results = {}
+        with override_settings(**overrides):
+            client = Client()
+            for name, path in self.endpoints(targets):
+                results[name] = self.measure(client, path, headers, options["requests"], options["warmup"])
+
+        report = json.dumps(
+            {"requests": options["requests"], "cache": options["cache"], "endpoints": results},
+            indent=2,
+            sort_keys=True,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report + "\n")
+        else:
+            self.stdout.write(report)
+
+    def targets(self, prefix):
+        """The biggest seeded group, its busiest finished event and an admin of the group."""
+        group = Group.objects.filter(name__startswith=prefix + "-").order_by("-member_count").first()
+        if group is None:
+            raise CommandError("No seeded groups, run seed_bwf --prefix {} first".format(prefix))
+        event = (
+            Event.objects.filter(group=group, time__lt=timezone.now())
+            .annotate(bets_total=Count("bets"))
+            .order_by("-bets_total")
+            .first()
+        )
+        member = Member.objects.filter(group=group, admin=True).select_related("user__profile").first()
+        if event is None or member is None:
+            raise CommandError("The seeded group {} has no finished event or admin".format(group.id))
+        return {
+            "user": member.user,
+            Group: group.pk,
+            Event: event.pk,
+            Member: member.pk,
+            Bet: Bet.objects.filter(event=event).values_list("pk", flat=True).first(),
+            Comment: Comment.objects.filter(group=group).values_list("pk", flat=True).first(),
+            User: member.user.pk,
+            UserProfile: member.user.profile.pk,
+        }
+
+    def endpoints(self, targets):
+        """(name, path) of the list, detail and GET extra actions of every registered viewset."""
+        for prefix, viewset, basename in router.registry:
+            pk = targets.get(viewset.queryset.model)
+            yield "{}-list".format(basename), "/api/{}/".format(prefix)
+            if pk is not None:
+                yield "{}-detail".format(basename), "/api/{}/{}/".format(prefix, pk)
+            for extra in viewset.get_extra_actions():
+                if "get" not in extra.mapping or (extra.detail and pk is None):
+                    continue
+                if extra.detail:
+                    path = "/api/{}/{}/{}/".format(prefix, pk, extra.url_path)
+                else:
+                    path = "/api/{}/{}/".format(prefix, extra.url_path)
+                yield "{}-{}".format(basename, extra.url_name), path
+
+    def measure(self, client, path, headers, num_requests, warmup):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        latencies, sizes, statuses = [], [], set()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            for index in range(warmup + num_requests):
+                queries.append(0)
+                started = time.perf_counter()
+                response = client.get(path, headers=headers)
+                if response.streaming:
+                    content = b"".join(response.streaming_content)
+                else:
+                    content = response.content
+                elapsed = time.perf_counter() - started
+                if index >= warmup:
+                    latencies.append(elapsed)
+                    sizes.append(len(content))
+                    statuses.add(response.status_code)
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            "path": path,
+            "status": sorted(statuses),
+            "p50_ms": round(quantiles[49] * 1000, 2),
+            "p95_ms": round(quantiles[94] * 1000, 2),
+            "queries": max(queries[warmup:]),
+            "bytes": max(sizes),
+        }
@@ -0,0 +1,118 @@
+import asyncio
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import Group, Event, Member, Comment, Bet
+
+
+def reload_urls():
+    import api.urls
+    import bwf.urls
+
+    clear_url_caches()
+    importlib.reload(api.urls)
+    importlib.reload(bwf.urls)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares concurrent throughput of the DRF read endpoints (WSGI) with "
+        "their async versions (ASGI). The response cache is bypassed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--members", type=int, default=200)
+
+    def handle(self, *args, **options):
+        group, event, token = self.seed(options["members"])
+        try:
+            paths = {
+                "group-list": "/api/groups/",
+                "group-detail": "/api/groups/{}/".format(group.id),
+                "event-detail": "/api/events/{}/".format(event.id),
+                "comment-list": "/api/comments/",
+            }
+            headers = {"Authorization": "Token " + token.key}
+            caches = dict(settings.CACHES, bench={"BACKEND": "django.core.cache.backends.dummy.DummyCache"})
+
+            with override_settings(CACHES=caches, API_CACHE_ALIAS="bench", ALLOWED_HOSTS=["testserver"]):
+                for name, path in paths.items():
+                    wsgi = self.run_wsgi(path, headers, options["requests"], options["concurrency"])
+                    with override_settings(API_ASYNC_VIEWS={name: True}):
+                        reload_urls()
+                        asgi = asyncio.run(self.run_asgi(path, headers, options["requests"], options["concurrency"]))
+                    reload_urls()
+                    self.stdout.write(
+                        "{:<14} wsgi {:>8.1f} req/s   asgi {:>8.1f} req/s".format(name, wsgi, asgi)
+                    )
+        finally:
+            Group.objects.filter(pk=group.pk).delete()
+            User.objects.filter(username__startswith="bench-async-").delete()
+
+    def seed(self, members):
+        users = User.objects.bulk_create(
+            [User(username="bench-async-{}".format(i), password="!") for i in range(members)]
+        )
+        group = Group.objects.create(name="bench-async", location="bench", description="bench")
+        Member.objects.bulk_create([Member(group=group, user=user) for user in users])
+        event = Event.objects.create(
+            team1="home", team2="away", time=timezone.now() - timedelta(hours=1), group=group
+        )
+        Bet.objects.bulk_create([Bet(user=user, event=event, score1=1, score2=0) for user in users])
+        Comment.objects.bulk_create(
+            [Comment(group=group, user=user, description="bench") for user in users[:50]]
+        )
+        return group, event, Token.objects.create(user=users[0])
+
+    def run_wsgi(self, path, headers, num_requests, concurrency):
+        statuses = []
+
+        def worker(count):
+            client = Client()
+            try:
+                for _ in range(count):
+                    statuses.append(client.get(path, headers=headers).status_code)
+            finally:
+                connection.close()
+
+        counts = [num_requests // concurrency] * concurrency
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, counts))
+        elapsed = time.perf_counter() - started
+        self.check_statuses(statuses)
+        return sum(counts) / elapsed
+
+    def check_statuses(self, statuses):
+        failed = [code for code in statuses if code != 200]
+        if failed:
+            raise CommandError("{} requests failed, e.g. with status {}".format(len(failed), failed[0]))
+
+    async def run_asgi(self, path, headers, num_requests, concurrency):
+        client = AsyncClient()
+        statuses = []
+
+        async def worker(count):
+            for _ in range(count):
+                response = await client.get(path, headers=headers)
+                statuses.append(response.status_code)
+
+        counts = [num_requests // concurrency] * concurrency
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(count) for count in counts))
+        elapsed = time.perf_counter() - started
+        self.check_statuses(statuses)
+        return sum(counts) / elapsed
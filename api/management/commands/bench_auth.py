@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.authentication import CachedTokenAuthentication, token_cache
+
+
+class Command(BaseCommand):
+    help = "Compares the per-request cost of TokenAuthentication and CachedTokenAuthentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        num_requests = options["requests"]
+
+        with transaction.atomic():
+            user = User.objects.create(username="bench-auth", password="!")
+            token = Token.objects.create(user=user)
+            request = Request(
+                APIRequestFactory().get("/api/groups/", HTTP_AUTHORIZATION="Token " + token.key)
+            )
+
+            token_cache.clear()
+            for backend in (TokenAuthentication(), CachedTokenAuthentication()):
+                queries = []
+
+                def count_query(execute, sql, params, many, context):
+                    queries.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count_query):
+                    started = time.perf_counter()
+                    for _ in range(num_requests):
+                        backend.authenticate(request)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    "{}: {:.1f}us/request, {} queries for {} requests".format(
+                        type(backend).__name__, elapsed / num_requests * 1e6, len(queries), num_requests
+                    )
+                )
+
+            transaction.set_rollback(True)
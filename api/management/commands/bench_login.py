@@ -0,0 +1,121 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
+
+from api.models import UserProfile
+from api.serializers import UserSerializer
+from api.views import CustomObtainAuthToken
+
+PASSWORD = "bench-login-password"
+
+
+class LegacyObtainAuthToken(ObtainAuthToken):
+    """The login view before the fast path, kept as the baseline."""
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        token = Token.objects.get(key=response.data["token"])
+        user = User.objects.get(id=token.user_id)
+        return Response({"token": token.key, "user": UserSerializer(user, many=False).data})
+
+
+class Command(BaseCommand):
+    help = (
+        "Login storm: concurrent logins through the previous and the current "
+        "login view, with the latency of a cheap read endpoint measured "
+        "alongside to show how much the hashing starves other requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=48)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def handle(self, *args, **options):
+        if options["logins"] < options["concurrency"]:
+            raise CommandError("--logins must be at least --concurrency")
+        users = self.seed(options["logins"])
+        try:
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                for name, view, backend in (
+                    ("legacy", LegacyObtainAuthToken, "django.contrib.auth.backends.ModelBackend"),
+                    ("fast path", CustomObtainAuthToken, "api.authentication.PasswordVerifierBackend"),
+                ):
+                    with override_settings(AUTHENTICATION_BACKENDS=[backend]):
+                        self.storm(name, view.as_view(), users, options["concurrency"])
+        finally:
+            User.objects.filter(username__startswith="bench-login-").delete()
+
+    def seed(self, count):
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            [User(username="bench-login-{}".format(i), password=password) for i in range(count)]
+        )
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        return users
+
+    def storm(self, name, view, users, concurrency):
+        factory = RequestFactory()
+        latencies, queries, failures = [], [], []
+        reads = []
+        done = threading.Event()
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def login(user):
+            request = factory.post(
+                "/api/authenticate/",
+                {"username": user.username, "password": PASSWORD},
+                content_type="application/json",
+            )
+            try:
+                with connection.execute_wrapper(count_query):
+                    started = time.perf_counter()
+                    response = view(request)
+                    latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+            finally:
+                connection.close()
+
+        def read():
+            client = Client()
+            try:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    client.get("/api/groups/")
+                    reads.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(login, users))
+        elapsed = time.perf_counter() - started
+        done.set()
+        reader.join()
+
+        if failures:
+            raise CommandError("{} logins failed, e.g. with status {}".format(len(failures), failures[0]))
+        login_q = statistics.quantiles(latencies, n=100)
+        read_q = statistics.quantiles(reads, n=100) if len(reads) > 1 else [reads[0]] * 99
+        self.stdout.write(
+            "{:<10} {:>6.1f} logins/s  login p50 {:>7.0f} ms p95 {:>7.0f} ms  {:.1f} queries/login  "
+            "reads during storm p95 {:>6.0f} ms".format(
+                name, len(users) / elapsed, login_q[49] * 1000, login_q[94] * 1000,
+                len(queries) / len(users), read_q[94] * 1000,
+            )
+        )
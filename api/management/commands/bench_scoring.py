@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Group, Event, Bet
+from api.scoring import score_event
+
+
+class Command(BaseCommand):
+    help = "Settles an event with a large number of bets and reports the timing. All data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bets", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--scoring", default="classic")
+
+    def handle(self, *args, **options):
+        num_bets = options["bets"]
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            group = Group.objects.create(
+                name="bench-scoring", location="bench", description="bench", scoring=options["scoring"]
+            )
+            event = Event.objects.create(
+                team1="home", team2="away", time=timezone.now(), group=group
+            )
+
+            started = time.perf_counter()
+            users = User.objects.bulk_create(
+                [User(username="bench-scoring-{}".format(i), password="!") for i in range(num_bets)],
+                batch_size=batch_size,
+            )
+            Bet.objects.bulk_create(
+                [
+                    Bet(user=user, event=event, score1=random.randint(0, 4), score2=random.randint(0, 4))
+                    for user in users
+                ],
+                batch_size=batch_size,
+            )
+            self.stdout.write("seeded {} bets in {:.2f}s".format(num_bets, time.perf_counter() - started))
+
+            event.score1 = 2
+            event.score2 = 1
+            event.save()
+
+            started = time.perf_counter()
+            updated = score_event(event)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                "scored {} bets in {:.3f}s ({:.0f} bets/s)".format(updated, elapsed, updated / elapsed)
+            )
+
+            transaction.set_rollback(True)
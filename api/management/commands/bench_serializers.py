@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory, override_settings
+from rest_framework.request import Request
+
+from api import payloads, sparse
+from api.models import Bet, Comment, Member, Standing
+from api.serializers import BetSerializer, CommentSerializer, MemberSerializer
+
+PER_ROWS = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU time per 10k rows of the bet, comment and member lists: model "
+        "serializers, the same with ?expand= (nested users as ids) and the "
+        ".values() rows of api/payloads.py. Needs seed_bwf data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=PER_ROWS)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest counts")
+
+    def handle(self, *args, **options):
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            request = Request(RequestFactory().get("/"))
+            standing = Standing.objects.filter(group=OuterRef("group"), user=OuterRef("user"))
+            members = Member.objects.annotate(points=Coalesce(Subquery(standing.values("points")[:1]), 0))
+            bets = Bet.objects.select_related("user__profile")
+            resources = [
+                ("bets", bets, BetSerializer, payloads.BET_VALUES, lambda row: payloads.bet(row, request)),
+                ("comments", Comment.objects.all(), CommentSerializer, payloads.COMMENT_VALUES, payloads.comment),
+                ("members", members.select_related("user__profile"), MemberSerializer,
+                 payloads.MEMBER_VALUES, payloads.member),
+            ]
+            for name, queryset, serializer_class, values, build in resources:
+                queryset = queryset.order_by("id")[:options["rows"]]
+                rows = queryset.count()
+                if not rows:
+                    raise CommandError("No {}, run seed_bwf first".format(name))
+                context = {"request": request}
+                cases = [
+                    ("serializer", lambda: serializer_class(list(queryset), many=True, context=context).data),
+                    ("serializer ?expand=", lambda: serializer_class(
+                        list(queryset), many=True, context=context, expand=set()
+                    ).data),
+                    ("values()", lambda: [build(row) for row in queryset.values(*values)]),
+                    ("values() ?expand=", lambda: [
+                        sparse.prune(build(row), expand=set()) for row in queryset.values(*values)
+                    ]),
+                ]
+                for case, run in cases:
+                    self.report(name, case, rows, run, options["repeat"])
+
+    def report(self, name, case, rows, run, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            run()
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(
+            "{:<9} {:<20} {:>9.0f} ms CPU per {} rows ({} rows)".format(
+                name, case, best * 1000 * PER_ROWS / rows, PER_ROWS, rows
+            )
+        )
@@ -0,0 +1,117 @@
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import Group, Event, Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures read latency while place_bet writes are in flight. Run it "
+        "with and without BWF_SQLITE_PRODUCTION=1 to compare the profiles. "
+        "The response cache is bypassed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        group, event, tokens = self.seed(options["writers"] + 1)
+        try:
+            caches = dict(settings.CACHES, bench={"BACKEND": "django.core.cache.backends.dummy.DummyCache"})
+            with override_settings(CACHES=caches, API_CACHE_ALIAS="bench", ALLOWED_HOSTS=["testserver"]):
+                self.report(group, event, tokens, options)
+        finally:
+            Group.objects.filter(pk=group.pk).delete()
+            User.objects.filter(username__startswith="bench-sqlite-").delete()
+
+    def report(self, group, event, tokens, options):
+        self.stdout.write("production profile: {}, replicas: {}".format(
+            settings.SQLITE_PRODUCTION, ", ".join(settings.SQLITE_READ_REPLICAS) or "none"
+        ))
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.stdout.write("journal mode: {}".format(cursor.fetchone()[0]))
+
+        path = "/api/groups/{}/".format(group.id)
+        for writers in (0, options["writers"]):
+            latencies, writes, failures = self.run(
+                path, event, tokens, options["readers"], writers, options["seconds"]
+            )
+            if failures:
+                raise CommandError("{} requests failed, e.g. with status {}".format(len(failures), failures[0]))
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                "{} writers: {:>6} reads  p50 {:>7.2f} ms  p95 {:>7.2f} ms  max {:>7.2f} ms  {:>6} writes".format(
+                    writers, len(latencies), quantiles[49] * 1000, quantiles[94] * 1000,
+                    max(latencies) * 1000, writes,
+                )
+            )
+
+    def seed(self, num_users):
+        users = User.objects.bulk_create(
+            [User(username="bench-sqlite-{}".format(i), password="!") for i in range(num_users)]
+        )
+        group = Group.objects.create(name="bench-sqlite", location="bench", description="bench")
+        Member.objects.bulk_create([Member(group=group, user=user) for user in users])
+        event = Event.objects.create(
+            team1="home", team2="away", time=timezone.now() + timedelta(days=1), group=group
+        )
+        return group, event, [Token.objects.create(user=user) for user in users]
+
+    def run(self, path, event, tokens, readers, writers, seconds):
+        deadline = time.monotonic() + seconds
+        latencies, writes, failures = [], [], []
+
+        def close_connections():
+            for conn in connections.all():
+                conn.close()
+
+        def read(token):
+            client = Client()
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    response = client.get(path, headers={"Authorization": "Token " + token.key})
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+            finally:
+                close_connections()
+
+        def write(token):
+            client = Client()
+            score = 0
+            try:
+                while time.monotonic() < deadline:
+                    score += 1
+                    response = client.post(
+                        "/api/bets/place_bet/",
+                        {"event": event.id, "score1": score % 5, "score2": score % 3},
+                        content_type="application/json",
+                        headers={"Authorization": "Token " + token.key},
+                    )
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+                    writes.append(1)
+            finally:
+                close_connections()
+
+        threads = [threading.Thread(target=read, args=(tokens[0],)) for _ in range(readers)]
+        threads += [threading.Thread(target=write, args=(token,)) for token in tokens[1:writers + 1]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, len(writes), failures
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from django.views import static
+
+from bwf import serve
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares django.views.static.serve, which bwf/urls.py used through "
+        "static(), with bwf.serve for a hashed static file and a media file. "
+        "Needs collectstatic to have run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--media-size", type=int, default=1024 * 1024, help="Bytes of the media file")
+
+    def handle(self, *args, **options):
+        try:
+            static_name = staticfiles_storage.stored_name("admin/js/actions.js")
+        except ValueError:
+            raise CommandError("No staticfiles manifest, run collectstatic first")
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with open(os.path.join(media_root, "avatar.jpg"), "wb") as media:
+                media.write(os.urandom(options["media_size"]))
+
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=["testserver"]):
+                cases = [
+                    ("static", static_name, staticfiles_storage.location),
+                    ("media", "avatar.jpg", media_root),
+                ]
+                for kind, path, root in cases:
+                    self.report(kind, "django static()", options["requests"],
+                                lambda request: static.serve(request, path, document_root=root))
+                    self.report(kind, "bwf.serve", options["requests"],
+                                lambda request: serve.serve(request, path, kind))
+                    with override_settings(SERVE_ACCEL_REDIRECT=True):
+                        self.report(kind, "bwf.serve accel", options["requests"],
+                                    lambda request: serve.serve(request, path, kind))
+
+    def report(self, kind, name, num_requests, view):
+        request = RequestFactory().get("/", headers={"Accept-Encoding": "gzip, deflate, br"})
+        sent = 0
+        started = time.perf_counter()
+        for _ in range(num_requests):
+            response = view(request)
+            body = b"".join(response) if response.streaming else response.content
+            response.close()
+            sent += len(body)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            "{:<7} {:<16} {:>9.0f} req/s {:>10.0f} bytes/response  Cache-Control: {}".format(
+                kind, name, num_requests / elapsed, sent / num_requests, response.get("Cache-Control", "-")
+            )
+        )
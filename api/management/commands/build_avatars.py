@@ -0,0 +1,46 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.avatars import save_variants, try_build_variants
+from api.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the avatar variants of existing profiles in a process pool and "
+        "strips the metadata of their originals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--force", action="store_true", help="Rebuild variants that are up to date")
+
+    def handle(self, *args, **options):
+        pending = [
+            (pk, image, variants)
+            for pk, image, variants in UserProfile.objects.exclude(image="")
+            .order_by("pk")
+            .values_list("pk", "image", "image_variants")
+            .iterator()
+            if options["force"] or variants.get("source") != image
+        ]
+        self.stdout.write("{} avatars to process".format(len(pending)))
+
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            names = [image for _, image, _ in pending]
+            for (pk, image, previous), variants in zip(pending, pool.map(try_build_variants, names, chunksize=8)):
+                if variants is not None and save_variants(pk, image, variants, previous):
+                    built += 1
+                else:
+                    failed += 1
+                done = built + failed
+                if done % 100 == 0:
+                    self.stdout.write("{}/{}".format(done, len(pending)))
+
+        self.stdout.write(self.style.SUCCESS("built {} avatars, {} failed or changed meanwhile".format(built, failed)))
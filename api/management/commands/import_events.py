@@ -0,0 +1,72 @@
+import io
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import schedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a fixture schedule from CSV, a JSON array or NDJSON (fields "
+        "group, team1, team2, time, optionally score1 and score2). Events "
+        "that already exist with the same group, teams and time are skipped, "
+        "new ones are inserted in batches, and the scores given for started "
+        "events are recorded and scored once per batch. Running it again "
+        "with more scores filled in enters the results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, - for stdin")
+        parser.add_argument("--format", choices=schedule.FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=settings.API_IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        input_format = options["format"] or self.guess_format(options["path"])
+        if options["path"] == "-":
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+        else:
+            source = open(options["path"], encoding="utf-8", newline="")
+
+        self.counts = Counter()
+        self.started = time.perf_counter()
+        with source:
+            rows = schedule.read(source, input_format)
+            try:
+                while True:
+                    batch = list(islice(rows, options["batch_size"]))
+                    if not batch:
+                        break
+                    self.count(schedule.import_batch(batch))
+                    self.stdout.write(self.progress())
+            except ValueError as error:
+                raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(self.progress()))
+
+    def guess_format(self, path):
+        if path.endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+        return "json" if path.endswith(".json") else "csv"
+
+    def count(self, results):
+        self.counts["rows"] += len(results)
+        for result in results:
+            self.counts[result["status"]] += 1
+            self.counts["scored"] += result["scored"]
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started
+        counts = self.counts
+        return (
+            "{} rows read, {} created, {} existing, {} scored, {} duplicate, {} invalid, "
+            "{} unknown group, {:.0f} rows/s".format(
+                counts["rows"], counts["created"], counts["existing"], counts["scored"],
+                counts["duplicate"], counts["invalid"], counts["not_found"],
+                counts["rows"] / elapsed if elapsed else 0,
+            )
+        )
@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from rest_framework.authtoken.models import Token
+
+from api.models import UserProfile
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+USERNAME_LENGTH = User._meta.get_field("username").max_length
+# NDJSON values may be of any JSON type, CSV ones are always strings
+TEXT_FIELDS = ("username", "password", "email", "bio")
+
+
+def hash_password(password):
+    # an empty password gives an unusable one, the user has to reset it
+    return make_password(password or None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users with profiles and tokens from CSV or NDJSON (fields "
+        "username, password, email, bio, is_premium). Passwords are hashed in "
+        "a process pool, rows are inserted in batches, each in its own "
+        "transaction. Usernames that already exist are skipped, so an "
+        "interrupted import is resumed by running it again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, - for stdin")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        input_format = options["format"] or ("ndjson" if options["path"].endswith((".ndjson", ".jsonl")) else "csv")
+        if options["path"] == "-":
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+        else:
+            source = open(options["path"], encoding="utf-8", newline="")
+
+        self.counts = dict.fromkeys(("rows", "created", "existing", "invalid"), 0)
+        self.seen = set()
+        self.started = time.perf_counter()
+
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+        with source, ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            rows = self.read(source, input_format)
+            pending = None
+            while True:
+                chunk = list(islice(rows, options["batch_size"]))
+                batch = self.prepare(chunk)
+                # hash the next batch while the current one is inserted
+                hashing = pool.map(
+                    hash_password,
+                    [row.get("password") for row in batch],
+                    chunksize=max(1, len(batch) // (options["workers"] * 4)),
+                )
+                if pending is not None:
+                    self.insert(*pending)
+                # a chunk of existing or invalid users is not the end of the input
+                if not chunk:
+                    break
+                pending = (batch, hashing) if batch else None
+
+        self.stdout.write(self.style.SUCCESS(self.progress()))
+
+    def read(self, source, input_format):
+        if input_format == "csv":
+            yield from csv.DictReader(source)
+            return
+        for number, line in enumerate(source, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise CommandError("line {} is not valid JSON".format(number))
+
+    def prepare(self, rows):
+        """Drops invalid rows, repeated usernames and users that already exist."""
+        self.counts["rows"] += len(rows)
+        valid = []
+        for row in rows:
+            if not isinstance(row, dict) or not all(
+                isinstance(row.get(name), (str, type(None))) for name in TEXT_FIELDS
+            ):
+                self.counts["invalid"] += 1
+                continue
+            username = (row.get("username") or "").strip()
+            try:
+                User.username_validator(username)
+            except ValidationError:
+                self.counts["invalid"] += 1
+                continue
+            if len(username) > USERNAME_LENGTH:
+                self.counts["invalid"] += 1
+                continue
+            if username in self.seen:
+                self.counts["existing"] += 1
+                continue
+            self.seen.add(username)
+            valid.append(dict(row, username=username))
+
+        existing = set(
+            User.objects.filter(username__in=[row["username"] for row in valid]).values_list("username", flat=True)
+        )
+        self.counts["existing"] += len(existing)
+        return [row for row in valid if row["username"] not in existing]
+
+    def insert(self, batch, hashes):
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=row["username"], email=row.get("email") or "", password=password)
+                for row, password in zip(batch, hashes)
+            ])
+            UserProfile.objects.bulk_create([
+                UserProfile(
+                    user=user,
+                    bio=row.get("bio") or None,
+                    is_premium=str(row.get("is_premium", "")).strip().lower() in TRUE_VALUES,
+                )
+                for user, row in zip(users, batch)
+            ])
+            Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+        self.counts["created"] += len(users)
+        self.stdout.write(self.progress())
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started
+        return "{rows} rows read, {created} created, {existing} existing, {invalid} invalid".format(
+            **self.counts
+        ) + ", {:.0f} rows/s".format(self.counts["rows"] / elapsed if elapsed else 0)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import sync
+from api.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the tombstones older than API_SYNC_TOMBSTONE_DAYS. The delta "
+        "sync refuses cursors from before then, so nothing reads them anymore."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=sync.retention_start()).delete()
+        self.stdout.write(self.style.SUCCESS("{} tombstones pruned".format(deleted)))
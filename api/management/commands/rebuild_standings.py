@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Bet, Standing
+from api.scoring import standing_totals
+
+
+class Command(BaseCommand):
+    help = "Recomputes group standings from the full bet history and replaces the stored ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", type=int, help="Only rebuild standings of this group")
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the stored standings with the recomputed ones, fail on mismatch",
+        )
+
+    def handle(self, *args, **options):
+        bets = Bet.objects.all()
+        standings = Standing.objects.all()
+        if options["group"]:
+            bets = bets.filter(event__group=options["group"])
+            standings = standings.filter(group=options["group"])
+
+        expected = {
+            (row["event__group"], row["user"]): (row["points_total"], row["exact_total"], row["outcome_total"])
+            for row in standing_totals(bets)
+        }
+        stored = {
+            (group_id, user_id): (points, exact_hits, outcome_hits)
+            for group_id, user_id, points, exact_hits, outcome_hits in standings.values_list(
+                "group_id", "user_id", "points", "exact_hits", "outcome_hits"
+            )
+        }
+
+        mismatches = 0
+        for key in expected.keys() | stored.keys():
+            # a stored all-zero row for a user without scored bets is harmless
+            if expected.get(key, (0, 0, 0)) != stored.get(key, (0, 0, 0)):
+                mismatches += 1
+                self.stdout.write(
+                    "group {} user {}: stored {} expected {}".format(key[0], key[1], stored.get(key), expected.get(key))
+                )
+
+        if options["verify"]:
+            if mismatches:
+                raise CommandError("{} standings do not match the bet history".format(mismatches))
+            self.stdout.write(self.style.SUCCESS("{} standings verified".format(len(expected))))
+            return
+
+        with transaction.atomic():
+            standings.delete()
+            Standing.objects.bulk_create(
+                [
+                    Standing(group_id=group_id, user_id=user_id, points=points, exact_hits=exact, outcome_hits=outcome)
+                    for (group_id, user_id), (points, exact, outcome) in expected.items()
+                ],
+                batch_size=1000,
+            )
+        self.stdout.write(
+            self.style.SUCCESS("rebuilt {} standings, {} had drifted".format(len(expected), mismatches))
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the global leaderboard snapshot from the group standings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every", type=float, help="Keep running and refresh every this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            entries = leaderboard.refresh()
+            self.stdout.write(
+                "leaderboard refreshed: {} entries in {:.2f}s".format(entries, time.perf_counter() - started)
+            )
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
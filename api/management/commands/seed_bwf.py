@@ -0,0 +1,174 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import UserProfile, Group, Event, Member, Comment, Bet, Standing
+from api.scoring import score_event, standing_totals
+
+TEAMS = [
+    "Arsenal", "Barcelona", "Benfica", "Celtic", "Dortmund", "Inter", "Juventus",
+    "Leipzig", "Liverpool", "Milan", "Napoli", "Porto", "PSG", "Real", "Roma", "Sevilla",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates users with profiles and tokens, groups, members, events, bets "
+        "and comments. Group sizes are skewed: a few huge groups hold most of "
+        "the members. Every seeded user logs in with --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--groups", type=int, default=100)
+        parser.add_argument("--huge-groups", type=int, default=2, help="Groups that every user has a --huge-share chance to join")
+        parser.add_argument("--huge-share", type=float, default=0.6)
+        parser.add_argument("--events", type=int, default=20, help="Events per group")
+        parser.add_argument("--finished", type=float, default=0.7, help="Share of events with a result")
+        parser.add_argument("--bet-rate", type=float, default=0.6, help="Chance that a member bets on an event")
+        parser.add_argument("--comments", type=int, default=30, help="Comments per group on average")
+        parser.add_argument("--password", default="bwf-seed")
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed")
+        parser.add_argument("--clear", action="store_true", help="Delete data of an earlier run with this prefix first")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        prefix = options["prefix"]
+
+        with transaction.atomic():
+            if options["clear"]:
+                Group.objects.filter(name__startswith=prefix + "-").delete()
+                User.objects.filter(username__startswith=prefix + "-").delete()
+
+            users = self.seed_users(prefix, options["users"], options["password"])
+            groups = self.seed_groups(prefix, options["groups"])
+            members = self.seed_members(groups, users, options["huge_groups"], options["huge_share"])
+            events = self.seed_events(groups, options["events"], options["finished"])
+            bets = self.seed_bets(events, members, options["bet_rate"])
+            comments = self.seed_comments(groups, members, options["comments"])
+            standings = self.seed_standings(groups, events)
+
+        self.stdout.write(self.style.SUCCESS(
+            "seeded {} users, {} groups, {} members, {} events, {} bets, {} comments, {} standings".format(
+                len(users), len(groups), sum(len(users) for users in members.values()),
+                len(events), bets, comments, standings,
+            )
+        ))
+
+    def seed_users(self, prefix, count, password):
+        # one hash for everyone, hashing per user would dominate the run
+        password = make_password(password)
+        users = User.objects.bulk_create(
+            [User(username="{}-{}".format(prefix, i), password=password) for i in range(count)],
+            batch_size=1000,
+        )
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, is_premium=self.random.random() < 0.1) for user in users],
+            batch_size=1000,
+        )
+        Token.objects.bulk_create(
+            [Token(key=Token.generate_key(), user=user) for user in users], batch_size=1000
+        )
+        return users
+
+    def seed_groups(self, prefix, count):
+        return Group.objects.bulk_create(
+            [
+                Group(name="{}-{}".format(prefix, i), location="seed", description="Seeded group {}".format(i))
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+
+    def seed_members(self, groups, users, huge_groups, huge_share):
+        """Group id -> member users, the sizes of the other groups follow a power law."""
+        members = {}
+        for index, group in enumerate(groups):
+            if index < huge_groups:
+                chosen = [user for user in users if self.random.random() < huge_share]
+            else:
+                size = min(len(users), int(self.random.paretovariate(1.5) * 5))
+                chosen = self.random.sample(users, size)
+            members[group.id] = chosen
+            group.member_count = len(chosen)
+
+        Group.objects.bulk_update(groups, ["member_count"], batch_size=1000)
+        Member.objects.bulk_create(
+            [
+                Member(group_id=group_id, user=user, admin=position == 0)
+                for group_id, chosen in members.items()
+                for position, user in enumerate(chosen)
+            ],
+            batch_size=1000,
+        )
+        return members
+
+    def seed_events(self, groups, count, finished):
+        now = timezone.now()
+        events = []
+        for group in groups:
+            for _ in range(count):
+                team1, team2 = self.random.sample(TEAMS, 2)
+                done = self.random.random() < finished
+                offset = timedelta(hours=self.random.randint(1, 24 * 60))
+                events.append(Event(
+                    group=group,
+                    team1=team1,
+                    team2=team2,
+                    time=now - offset if done else now + offset,
+                    score1=self.random.randint(0, 4) if done else None,
+                    score2=self.random.randint(0, 4) if done else None,
+                ))
+        return Event.objects.bulk_create(events, batch_size=1000)
+
+    def seed_bets(self, events, members, bet_rate):
+        bets = [
+            Bet(event=event, user=user, score1=self.random.randint(0, 3), score2=self.random.randint(0, 3))
+            for event in events
+            for user in members[event.group_id]
+            if self.random.random() < bet_rate
+        ]
+        Bet.objects.bulk_create(bets, batch_size=1000)
+        return len(bets)
+
+    def seed_comments(self, groups, members, average):
+        comments = []
+        for group in groups:
+            authors = members[group.id]
+            if not authors:
+                continue
+            # busy groups talk more
+            count = min(average * 10, int(self.random.expovariate(1 / average)) + len(authors) // 10)
+            comments += [
+                Comment(group=group, user=self.random.choice(authors), description="Seeded comment {}".format(i))
+                for i in range(count)
+            ]
+        Comment.objects.bulk_create(comments, batch_size=1000)
+        return len(comments)
+
+    def seed_standings(self, groups, events):
+        for event in events:
+            if event.score1 is not None:
+                score_event(event)
+
+        totals = standing_totals(Bet.objects.filter(event__group__in=groups))
+        return len(Standing.objects.bulk_create(
+            [
+                Standing(
+                    group_id=row["event__group"],
+                    user_id=row["user"],
+                    points=row["points_total"],
+                    exact_hits=row["exact_total"],
+                    outcome_hits=row["outcome_total"],
+                )
+                for row in totals
+            ],
+            batch_size=1000,
+        ))
@@ -0,0 +1,112 @@
+"""
+Per-request metrics collected by api.middleware.MetricsMiddleware: query
+count, SQL time and serializer time of the request in flight, plus the
+per-route aggregates served at /api/stats/requests/. The aggregates live
+in process memory, every worker reports its own.
+"""
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+current = contextvars.ContextVar("api_request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.slow_queries = []
+        self.serializing = False
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            if elapsed * 1000 >= settings.API_METRICS_SLOW_QUERY_MS:
+                self.slow_queries.append((elapsed, sql))
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # installed on every connection rather than around the request, so the
+    # queries count in whatever thread runs them: sync_to_async workers
+    # under ASGI, or the server iterating a streaming body, as long as the
+    # request's metrics are in the context
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation to the request metrics.
+    Nested serializers run inside the outermost one and are not counted
+    twice, the time includes queries issued while serializing.
+    """
+
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializing = False
+
+
+class RouteStats:
+    """Sums of the sampled requests per route name, thread-safe."""
+
+    FIELDS = ("queries", "sql_ms", "serializer_ms", "view_ms")
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, values):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = dict.fromkeys(self.FIELDS + ("max_view_ms",), 0)
+                entry["requests"] = 0
+            entry["requests"] += 1
+            for field in self.FIELDS:
+                entry[field] += values[field]
+            entry["max_view_ms"] = max(entry["max_view_ms"], values["view_ms"])
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: dict(entry) for route, entry in self._routes.items()}
+        return {
+            route: dict(
+                {"avg_" + field: round(entry[field] / entry["requests"], 2) for field in self.FIELDS},
+                requests=entry["requests"],
+                max_view_ms=round(entry["max_view_ms"], 2),
+            )
+            for route, entry in sorted(routes.items())
+        }
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_stats = RouteStats()
@@ -0,0 +1,137 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from api.metrics import RequestMetrics, current, route_stats
+
+logger = logging.getLogger("api.metrics")
+
+
+class MetricsMiddleware:
+    """
+    Measures a sample of the requests (settings.API_METRICS_SAMPLE_RATE):
+    query count, SQL time, serializer time and view time. They go out as a
+    Server-Timing header and a JSON log line on the api.metrics logger and
+    are summed per route for /api/stats/requests/. Slow requests and slow
+    queries are logged as warnings. Unsampled requests pay for one random()
+    call and a context variable lookup per query.
+
+    Queries are counted by api.metrics.record_query on every connection,
+    so those of sync_to_async threads count too. The body of a streaming
+    response is produced after the view returned: its Server-Timing header
+    covers the time before the first byte, the log line and route stats
+    are written when the response is closed and include the whole body.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def sampled(self):
+        rate = settings.API_METRICS_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def finish(self, request, response, metrics, started):
+        values = self.values(metrics, started)
+        response["Server-Timing"] = (
+            'db;dur={sql_ms:.2f};desc="{queries} queries", '
+            "ser;dur={serializer_ms:.2f}, view;dur={view_ms:.2f}".format(**values)
+        )
+        # files are sent as they are, sendfile() needs the file object
+        if response.streaming and getattr(response, "file_to_stream", None) is None:
+            if response.is_async:
+                response.streaming_content = self.measure_async(response.streaming_content, metrics)
+            else:
+                response.streaming_content = self.measure(response.streaming_content, metrics)
+            response._resource_closers.append(
+                lambda: self.report(request, response, self.values(metrics, started), metrics)
+            )
+        else:
+            self.report(request, response, values, metrics)
+        return response
+
+    def measure(self, content, metrics):
+        iterator = iter(content)
+        while True:
+            token = current.set(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                current.reset(token)
+            yield chunk
+
+    async def measure_async(self, content, metrics):
+        iterator = aiter(content)
+        while True:
+            token = current.set(metrics)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                current.reset(token)
+            yield chunk
+
+    def values(self, metrics, started):
+        return {
+            "queries": metrics.queries,
+            "sql_ms": metrics.sql_time * 1000,
+            "serializer_ms": metrics.serializer_time * 1000,
+            "view_ms": (time.perf_counter() - started) * 1000,
+        }
+
+    def report(self, request, response, values, metrics):
+        match = request.resolver_match
+        route = (match.url_name or match.route) if match is not None else "unresolved"
+        route_stats.add(route, values)
+
+        record = dict(
+            {key: round(value, 2) for key, value in values.items()},
+            route=route,
+            method=request.method,
+            status=response.status_code,
+        )
+        logger.info(json.dumps(record, sort_keys=True))
+        if values["view_ms"] >= settings.API_METRICS_SLOW_REQUEST_MS:
+            logger.warning("slow request %s", json.dumps(record, sort_keys=True))
+        for duration, sql in metrics.slow_queries:
+            logger.warning(
+                "slow query %s",
+                json.dumps({"route": route, "sql_ms": round(duration * 1000, 2), "sql": sql}, sort_keys=True),
+            )
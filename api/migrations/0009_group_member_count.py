@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_member_count(apps, schema_editor):
+    Group = apps.get_model('api', 'Group')
+    Member = apps.get_model('api', 'Member')
+    counts = (
+        Member.objects.filter(group=OuterRef('pk'))
+        .values('group')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Group.objects.update(member_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_alter_bet_score1_alter_bet_score2'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_member_count, migrations.RunPython.noop),
+    ]
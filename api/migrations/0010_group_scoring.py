@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_group_member_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='scoring',
+            field=models.CharField(choices=[('classic', 'Classic (3/1/0)'), ('goal_difference', 'Goal difference (3/2/1/0)'), ('exact', 'Exact result only (3/0)')], default='classic', max_length=16),
+        ),
+    ]
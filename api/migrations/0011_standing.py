@@ -0,0 +1,62 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def fill_standings(apps, schema_editor):
+    Bet = apps.get_model('api', 'Bet')
+    Standing = apps.get_model('api', 'Standing')
+    exact = Q(score1=F('event__score1'), score2=F('event__score2'))
+    outcome = (
+        Q(score1__gt=F('score2'), event__score1__gt=F('event__score2'))
+        | Q(score1__lt=F('score2'), event__score1__lt=F('event__score2'))
+        | Q(score1=F('score2'), event__score1=F('event__score2'))
+    )
+    totals = (
+        Bet.objects.filter(points__isnull=False, event__score1__isnull=False, event__score2__isnull=False)
+        .values('event__group', 'user')
+        .annotate(points=Sum('points'), exact=Count('id', filter=exact), outcome=Count('id', filter=outcome & ~exact))
+        .order_by()
+    )
+    Standing.objects.bulk_create(
+        [
+            Standing(
+                group_id=row['event__group'],
+                user_id=row['user'],
+                points=row['points'],
+                exact_hits=row['exact'],
+                outcome_hits=row['outcome'],
+            )
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_group_scoring'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Standing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0)),
+                ('exact_hits', models.IntegerField(default=0)),
+                ('outcome_hits', models.IntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='api.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.RunPython(fill_standings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_updated_at_tombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bet',
+            name='api_bet_user_id_a22523_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='member',
+            name='api_member_user_id_759469_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['event', 'user', 'points'], name='api_bet_event_i_0adee4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['group', '-time'], name='api_comment_group_i_0d28a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['group', 'time'], name='api_event_group_i_1ffa0f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standing',
+            index=models.Index(fields=['group', '-points'], name='api_standin_group_i_81d091_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 16:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_updated_at(apps, schema_editor):
+    # the best guess for bets placed before the field existed
+    Bet = apps.get_model('api', 'Bet')
+    Bet.objects.update(placed_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='placed_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+    ]
@@ -9,12 +9,23 @@ class UserProfile(models.Model):
     image = models.ImageField(upload_to=upload_path_handler, blank=True)
     is_premium = models.BooleanField(default=False)
     bio =models.CharField(max_length=256, null=True, blank=True)
+    # resized copies of image built by api/avatars.py: {"source": image name, "<size>": file name}
+    image_variants = models.JSONField(default=dict, blank=True)
 
 
 class Group(models.Model):
+    SCORING_CHOICES = (
+        ('classic', 'Classic (3/1/0)'),
+        ('goal_difference', 'Goal difference (3/2/1/0)'),
+        ('exact', 'Exact result only (3/0)'),
+    )
+
     name = models.CharField(max_length=32, null=False, unique=False)
     location = models.CharField(max_length=32, null=False)
     description = models.CharField(max_length=256, null=False, unique=False)
+    # denormalized counter, kept up to date by the Member signals in api/signals.py
+    member_count = models.PositiveIntegerField(default=0)
+    scoring = models.CharField(max_length=16, choices=SCORING_CHOICES, default='classic')
 
     class Meta:
         unique_together = (('name', 'location'))
@@ -29,16 +40,24 @@ class Event(models.Model):
     score1 = models.IntegerField(null=True, blank=True)
     score2 = models.IntegerField(null=True, blank=True)
     group = models.ForeignKey(Group, related_name='events', on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'time']),
+            models.Index(fields=['group', 'updated_at']),
+        ]
 
 class Member(models.Model):
     group = models.ForeignKey(Group, related_name='members', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='members_of', on_delete=models.CASCADE)
     admin = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = (('user', 'group'),)
         indexes = [
-            models.Index(fields=['user', 'group'])
+            models.Index(fields=['group', 'updated_at']),
         ]
 
 class Comment(models.Model):
@@ -46,6 +65,13 @@ class Comment(models.Model):
     user = models.ForeignKey(User, related_name='user_comments', on_delete=models.CASCADE)
     description = models.CharField(max_length=256, null=False, unique=False)
     time = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', '-time']),
+            models.Index(fields=['group', 'updated_at']),
+        ]
 
 class Bet(models.Model):
     user = models.ForeignKey(User, related_name='user_bets', on_delete=models.CASCADE)
@@ -53,9 +79,51 @@ class Bet(models.Model):
     score1 = models.IntegerField(null=True, blank=True)
     score2 = models.IntegerField(null=True, blank=True)
     points = models.IntegerField(default=None, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # when the user last set the scores, scoring only touches updated_at
+    placed_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = (('user', 'event'),)
         indexes = [
-            models.Index(fields=['user', 'event'])
+            # covers the per event lookups of the scoring and standings updates
+            models.Index(fields=['event', 'user', 'points']),
+            models.Index(fields=['event', 'updated_at']),
+        ]
+
+class Standing(models.Model):
+    group = models.ForeignKey(Group, related_name='standings', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='standings', on_delete=models.CASCADE)
+    points = models.IntegerField(default=0)
+    # exact result vs. correct outcome only, a bet counts towards one of them at most
+    exact_hits = models.IntegerField(default=0)
+    outcome_hits = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('group', 'user'),)
+        indexes = [
+            models.Index(fields=['group', '-points']),
         ]
+
+
+class Tombstone(models.Model):
+    """Marks a deleted event, member, comment or bet for the delta sync of its group."""
+    group = models.ForeignKey(Group, related_name='tombstones', on_delete=models.CASCADE)
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'deleted_at'])
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """Snapshot of the global leaderboard, rebuilt by api/leaderboard.py."""
+    user = models.OneToOneField(User, related_name='leaderboard_entry', on_delete=models.CASCADE)
+    points = models.IntegerField()
+    # shared by ties, position breaks them for paging
+    rank = models.PositiveIntegerField()
+    position = models.PositiveIntegerField(unique=True)
+    refreshed_at = models.DateTimeField()
@@ -0,0 +1,99 @@
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import pagination
+from rest_framework.utils import encoders
+
+from api import sparse
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination, the cost of a page does not depend on how deep it is.
+    Subclasses set a stable ordering for their resource.
+    """
+    ordering = 'id'
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    # pages at least this long are written out row by row
+    stream_threshold = getattr(settings, 'API_STREAM_THRESHOLD', 200)
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        paginate_queryset() on the async ORM for the forward pages of
+        api/async_views.py, with the same cursors. Previous links still go
+        to the sync view, which takes over reversed cursors.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, None)
+        self.cursor = self.decode_cursor(request)
+        offset, _, position = self.cursor or (0, False, None)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            order = self.ordering[0]
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            queryset = queryset.filter(**{order.lstrip('-') + lookup: position})
+        rows = [row async for row in queryset[offset:offset + self.page_size + 1].aiterator()]
+        self.page = rows[:self.page_size]
+
+        self.has_next = len(rows) > len(self.page)
+        self.has_previous = position is not None or offset > 0
+        if self.has_next:
+            self.next_position = self._get_position_from_instance(rows[-1], self.ordering)
+        if self.has_previous:
+            self.previous_position = position
+        return self.page
+
+    def get_streaming_response(self, page, to_representation):
+        def rows():
+            yield '{{"next": {}, "previous": {}, "results": ['.format(
+                json.dumps(self.get_next_link()), json.dumps(self.get_previous_link())
+            )
+            for index, instance in enumerate(page):
+                data = json.dumps(to_representation(instance), cls=encoders.JSONEncoder)
+                yield ',' + data if index else data
+            yield ']}'
+
+        return StreamingHttpResponse(rows(), content_type='application/json')
+
+
+class CommentPagination(CursorPagination):
+    ordering = ('-time', '-id')
+
+
+class EventPagination(CursorPagination):
+    ordering = ('time', 'id')
+
+
+class CursorListMixin:
+    """
+    List action for viewsets with a CursorPagination paginator. Viewsets
+    that set list_values list .values() rows turned into dicts by their
+    list_row(row) method (see api/payloads.py) instead of serializer
+    instances.
+    """
+    list_values = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.list_values is not None:
+            page = self.paginate_queryset(queryset.values(*self.list_values))
+            params = sparse.parse(request.query_params)
+
+            def to_representation(row):
+                return sparse.prune(self.list_row(row), **params)
+        else:
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            to_representation = serializer.child.to_representation
+
+        if len(page) >= self.paginator.stream_threshold and request.accepted_renderer.format == 'json':
+            return self.paginator.get_streaming_response(page, to_representation)
+        if self.list_values is not None:
+            return self.get_paginated_response([to_representation(row) for row in page])
+        return self.get_paginated_response(serializer.data)
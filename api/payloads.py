@@ -0,0 +1,152 @@
+"""
+Plain-dict versions of the api/serializers.py payloads, built from
+.values() rows instead of model instances and serializer fields. The
+output matches the serializers, see the async views in api/async_views.py.
+"""
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+_datetime = serializers.DateTimeField()
+
+USER_VALUES = (
+    'id', 'username', 'email',
+    'profile__id', 'profile__image', 'profile__is_premium', 'profile__bio',
+    'profile__image_variants',
+)
+
+
+def user_values(prefix):
+    return tuple(prefix + name for name in USER_VALUES)
+
+
+def format_datetime(value):
+    return _datetime.to_representation(value)
+
+
+def image_url(name, request=None):
+    # same as serializers.ImageField: absolute only with a request in context
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def variant_urls(image, variants, request=None):
+    """{size: url} of the avatar variants, empty until they are built from the current image."""
+    if not image or variants.get('source') != image:
+        return {}
+    return {size: image_url(name, request) for size, name in variants.items() if size != 'source'}
+
+
+def user(row, prefix='user__', request=None):
+    profile = None
+    if row[prefix + 'profile__id'] is not None:
+        profile = {
+            'id': row[prefix + 'profile__id'],
+            'image': image_url(row[prefix + 'profile__image'], request),
+            'is_premium': row[prefix + 'profile__is_premium'],
+            'bio': row[prefix + 'profile__bio'],
+            'image_variants': variant_urls(
+                row[prefix + 'profile__image'], row[prefix + 'profile__image_variants'], request
+            ),
+        }
+    return {
+        'id': row[prefix + 'id'],
+        'username': row[prefix + 'username'],
+        'email': row[prefix + 'email'],
+        'profile': profile,
+    }
+
+
+GROUP_VALUES = ('id', 'name', 'location', 'description')
+
+
+def group(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'location': row['location'],
+        'description': row['description'],
+        'num_members': row['members_total'],
+    }
+
+
+EVENT_VALUES = ('id', 'team1', 'team2', 'time', 'group')
+
+
+def event(row):
+    return {
+        'id': row['id'],
+        'team1': row['team1'],
+        'team2': row['team2'],
+        'time': format_datetime(row['time']),
+        'group': row['group'],
+    }
+
+
+EVENT_FULL_VALUES = ('id', 'team1', 'team2', 'time', 'score1', 'score2', 'group')
+
+
+def event_full(row, bets, is_admin, num_bets):
+    return {
+        'id': row['id'],
+        'team1': row['team1'],
+        'team2': row['team2'],
+        'time': format_datetime(row['time']),
+        'score1': row['score1'],
+        'score2': row['score2'],
+        'group': row['group'],
+        'bets': bets,
+        'is_admin': is_admin,
+        'num_bets': num_bets,
+    }
+
+
+BET_VALUES = ('id', 'event', 'score1', 'score2', 'points') + user_values('user__')
+
+
+def bet(row, request=None):
+    return {
+        'id': row['id'],
+        'user': user(row, request=request),
+        'event': row['event'],
+        'score1': row['score1'],
+        'score2': row['score2'],
+        'points': row['points'],
+    }
+
+
+MEMBER_VALUES = ('group', 'admin', 'points') + user_values('user__')
+
+
+def member(row, request=None):
+    return {
+        'user': user(row, request=request),
+        'group': row['group'],
+        'admin': row['admin'],
+        'points': row['points'],
+    }
+
+
+COMMENT_VALUES = ('user', 'group', 'description', 'time')
+
+
+def comment(row):
+    return {
+        'user': row['user'],
+        'group': row['group'],
+        'description': row['description'],
+        'time': format_datetime(row['time']),
+    }
+
+
+LEADERBOARD_VALUES = ('points', 'rank', 'position', 'refreshed_at') + user_values('user__')
+
+
+def leaderboard_entry(row, request=None):
+    return {
+        'user': user(row, request=request),
+        'points': row['points'],
+        'rank': row['rank'],
+        'position': row['position'],
+    }
@@ -0,0 +1,204 @@
+"""
+Bulk schedule import and result entry, shared by the EventViewSet actions
+and the import_events command. Rows are cleaned and checked in batches:
+one query for the groups, one for the events they may duplicate on
+(group, team1, team2, time), one bulk_create, and the results of a batch
+are scored together through scoring.record_results.
+"""
+import csv
+import json
+from datetime import datetime
+
+import pytz
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import cache
+from api.broker import broker
+from api.models import Event, Group
+from api.scoring import record_results
+
+TEAM_LENGTH = Event._meta.get_field("team1").max_length
+FORMATS = ("csv", "json", "ndjson")
+
+
+def read(source, input_format):
+    """Rows of a CSV file, a JSON array or NDJSON lines as dicts."""
+    if input_format == "csv":
+        yield from csv.DictReader(source)
+    elif input_format == "json":
+        data = json.load(source)
+        if not isinstance(data, list):
+            raise ValueError("expected a JSON array of events")
+        yield from data
+    else:
+        for number, line in enumerate(source, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise ValueError("line {} is not valid JSON".format(number))
+
+
+def parse_score(value):
+    if value is None or value == "":
+        return None
+    score = int(value)
+    if score < 0:
+        raise ValueError(score)
+    return score
+
+
+def clean(row):
+    """(group id, team1, team2, time, scores or None), ValueError for a bad row."""
+    if not isinstance(row, dict):
+        raise ValueError(row)
+    try:
+        group_id = int(row["group"])
+        team1 = str(row["team1"]).strip()
+        team2 = str(row["team2"]).strip()
+        time = parse_datetime(str(row["time"]).strip())
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(row)
+    if time is None or not (0 < len(team1) <= TEAM_LENGTH) or not (0 < len(team2) <= TEAM_LENGTH):
+        raise ValueError(row)
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time)
+    try:
+        scores = (parse_score(row.get("score1")), parse_score(row.get("score2")))
+    except (TypeError, ValueError):
+        raise ValueError(row)
+    if None in scores:
+        if scores != (None, None):
+            raise ValueError(row)
+        scores = None
+    return group_id, team1, team2, time, scores
+
+
+def import_batch(rows, admin_of=None):
+    """
+    Creates the events of a batch of schedule rows and records the scores
+    given for events that have started. admin_of limits the rows to those
+    group ids, None allows every group. Returns one
+    {"event", "status", "scored"} per row, status being created, existing,
+    duplicate (repeated in the batch), invalid, not_found or forbidden.
+    """
+    statuses = [None] * len(rows)
+    wanted = {}
+    for index, row in enumerate(rows):
+        try:
+            group_id, team1, team2, time, scores = clean(row)
+        except ValueError:
+            statuses[index] = {"event": None, "status": "invalid", "scored": False}
+            continue
+        key = (group_id, team1, team2, time)
+        if key in wanted:
+            statuses[index] = {"event": None, "status": "duplicate", "scored": False}
+            continue
+        wanted[key] = (index, scores)
+
+    group_ids = {group_id for group_id, _, _, _ in wanted}
+    found = set(Group.objects.filter(pk__in=group_ids).values_list("pk", flat=True))
+    for key, (index, _) in list(wanted.items()):
+        if key[0] not in found:
+            status = "not_found"
+        elif admin_of is not None and key[0] not in admin_of:
+            status = "forbidden"
+        else:
+            continue
+        statuses[index] = {"event": None, "status": status, "scored": False}
+        del wanted[key]
+    if not wanted:
+        return statuses
+
+    now = datetime.now(pytz.UTC)
+    with transaction.atomic():
+        times = [time for _, _, _, time in wanted]
+        existing = {
+            (event.group_id, event.team1, event.team2, event.time): event
+            for event in Event.objects.filter(
+                group_id__in={group_id for group_id, _, _, _ in wanted},
+                time__range=(min(times), max(times)),
+            ).only("group_id", "team1", "team2", "time", "score1", "score2")
+            if (event.group_id, event.team1, event.team2, event.time) in wanted
+        }
+
+        new = [
+            Event(group_id=group_id, team1=team1, team2=team2, time=time)
+            for group_id, team1, team2, time in wanted
+            if (group_id, team1, team2, time) not in existing
+        ]
+        Event.objects.bulk_create(new, batch_size=500)
+        # bulk_create sends no post_save
+        for group_id in {event.group_id for event in new}:
+            cache.invalidate_on_commit("group", group_id)
+
+        events = dict(existing)
+        events.update(((event.group_id, event.team1, event.team2, event.time), event) for event in new)
+        results = []
+        for key, (index, scores) in wanted.items():
+            event = events[key]
+            statuses[index] = {
+                "event": event.pk,
+                "status": "existing" if key in existing else "created",
+                "scored": False,
+            }
+            if scores is not None and event.time < now and scores != (event.score1, event.score2):
+                results.append((event, *scores))
+                statuses[index]["scored"] = True
+        record(results)
+    return statuses
+
+
+def enter_results(items, admin_of=None):
+    """
+    Records many final scores at once from {"event", "score1", "score2"}
+    items, later items for the same event win. Returns one
+    {"event", "status"} per item, status being scored, superseded,
+    invalid, not_found, forbidden or too_early.
+    """
+    statuses = [None] * len(items)
+    wanted = {}
+    for index, item in enumerate(items):
+        try:
+            event_id = int(item["event"])
+            scores = (parse_score(item["score1"]), parse_score(item["score2"]))
+        except (KeyError, TypeError, ValueError):
+            statuses[index] = {"event": None, "status": "invalid"}
+            continue
+        if None in scores:
+            statuses[index] = {"event": event_id, "status": "invalid"}
+            continue
+        if event_id in wanted:
+            statuses[wanted[event_id][0]] = {"event": event_id, "status": "superseded"}
+        wanted[event_id] = (index, scores)
+
+    now = datetime.now(pytz.UTC)
+    with transaction.atomic():
+        events = Event.objects.select_for_update().in_bulk(list(wanted))
+        results = []
+        for event_id, (index, scores) in wanted.items():
+            event = events.get(event_id)
+            if event is None:
+                status = "not_found"
+            elif admin_of is not None and event.group_id not in admin_of:
+                status = "forbidden"
+            elif event.time >= now:
+                status = "too_early"
+            else:
+                results.append((event, *scores))
+                status = "scored"
+            statuses[index] = {"event": event_id, "status": status}
+        record(results)
+    return statuses
+
+
+def record(results):
+    record_results(results)
+    for event, score1, score2 in results:
+        broker.publish_on_commit(
+            event.group_id,
+            "event_scored",
+            {"event": event.id, "score1": score1, "score2": score2},
+        )
@@ -0,0 +1,237 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api import cache
+from api.models import Bet, Event, Group, Standing
+
+
+def outcome_filter(score1, score2):
+    # bets that picked the same winner (or a draw) as the final score
+    if score1 > score2:
+        return Q(score1__gt=F('score2'))
+    if score1 < score2:
+        return Q(score1__lt=F('score2'))
+    return Q(score1=F('score2'))
+
+
+def exact_filter(score1, score2):
+    return Q(score1=score1, score2=score2)
+
+
+class ScoringPolicy:
+    """Awards points for an exact result, a correct outcome or a miss."""
+
+    def __init__(self, exact=3, outcome=1, miss=0):
+        self.exact = exact
+        self.outcome = outcome
+        self.miss = miss
+
+    def rules(self, score1, score2):
+        # classic 3/1/0:
+        # 1:1 bet 1:1 = 3pts
+        # 1:1 bet 2:2 = 1pts
+        # 1:2 bet 2:1 = 0pts
+        return [
+            When(exact_filter(score1, score2), then=Value(self.exact)),
+            When(outcome_filter(score1, score2), then=Value(self.outcome)),
+        ]
+
+    def points(self, score1, score2):
+        return Case(*self.rules(score1, score2), default=Value(self.miss))
+
+
+class GoalDifferencePolicy(ScoringPolicy):
+    """Like the classic policy, with extra points for the right goal difference."""
+
+    def __init__(self, exact=3, difference=2, outcome=1, miss=0):
+        super().__init__(exact, outcome, miss)
+        self.difference = difference
+
+    def rules(self, score1, score2):
+        exact, outcome = super().rules(score1, score2)
+        difference = When(score1=F('score2') + (score1 - score2), then=Value(self.difference))
+        return [exact, difference, outcome]
+
+
+POLICIES = {
+    'classic': ScoringPolicy(),
+    'goal_difference': GoalDifferencePolicy(),
+    'exact': ScoringPolicy(outcome=0),
+}
+
+
+def get_policy(name):
+    return POLICIES.get(name, POLICIES['classic'])
+
+
+def score_event(event):
+    """Sets the points of every bet on a finished event in one UPDATE."""
+    policy = get_policy(event.group.scoring)
+    with transaction.atomic():
+        return Bet.objects.filter(event=event).update(
+            points=policy.points(int(event.score1), int(event.score2)),
+            updated_at=timezone.now(),
+        )
+
+
+def record_result(event, score1, score2):
+    """
+    Saves the final score of an event, scores its bets and applies the
+    difference to the group standings. Re-scoring an event first takes
+    back what the previous result contributed.
+    """
+    with transaction.atomic():
+        # the standings hold the stored result, which a concurrent call may
+        # have changed since the caller loaded the event
+        previous = Event.objects.select_for_update().values_list('score1', 'score2').get(pk=event.pk)
+        if None not in previous:
+            event.score1, event.score2 = previous
+            update_standings(event, -1)
+
+        event.score1 = score1
+        event.score2 = score2
+        event.save()
+        score_event(event)
+
+        missing = (
+            Bet.objects.filter(event=event)
+            .exclude(Exists(Standing.objects.filter(group_id=event.group_id, user=OuterRef('user'))))
+            .values_list('user_id', flat=True)
+        )
+        Standing.objects.bulk_create(
+            [Standing(group_id=event.group_id, user_id=user_id) for user_id in missing],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        update_standings(event, 1)
+
+
+def record_results(results):
+    """
+    record_result for many events at once, given (event, score1, score2)
+    triples. Bets are scored with one UPDATE per scoring policy and final
+    score, and the standings get the summed difference of all events, one
+    UPDATE per group and distinct difference, instead of a handful of
+    queries per event. Returns the number of bets scored.
+    """
+    results = list(results)
+    if not results:
+        return 0
+    events = [event for event, _, _ in results]
+    event_ids = [event.pk for event in events]
+    scoring = dict(
+        Group.objects.filter(pk__in={event.group_id for event in events}).values_list('pk', 'scoring')
+    )
+
+    with transaction.atomic():
+        # (group, user) -> [points, exact hits, outcome hits]
+        delta = defaultdict(lambda: [0, 0, 0])
+        rescored = [event.pk for event in events if event.score1 is not None and event.score2 is not None]
+        if rescored:
+            add_totals(delta, Bet.objects.filter(event__in=rescored), -1)
+
+        now = timezone.now()
+        scorelines = defaultdict(list)
+        for event, score1, score2 in results:
+            event.score1, event.score2, event.updated_at = score1, score2, now
+            scorelines[(scoring[event.group_id], score1, score2)].append(event.pk)
+        Event.objects.bulk_update(events, ['score1', 'score2', 'updated_at'], batch_size=500)
+
+        scored = 0
+        for (name, score1, score2), ids in scorelines.items():
+            scored += Bet.objects.filter(event__in=ids).update(
+                points=get_policy(name).points(score1, score2), updated_at=now
+            )
+
+        add_totals(delta, Bet.objects.filter(event__in=event_ids), 1)
+        Standing.objects.bulk_create(
+            [Standing(group_id=group_id, user_id=user_id) for group_id, user_id in delta],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        apply_differences(delta)
+
+        # bulk_update sends no post_save
+        for event in events:
+            cache.invalidate_on_commit('event', event.pk)
+        for group_id in {event.group_id for event in events}:
+            cache.invalidate_on_commit('group', group_id)
+    return scored
+
+
+def take_back(bets):
+    """Removes what the given bets contributed to the standings, call it before deleting them."""
+    delta = defaultdict(lambda: [0, 0, 0])
+    add_totals(delta, bets, -1)
+    apply_differences(delta)
+
+
+def apply_differences(delta):
+    # few distinct differences per group, e.g. +3 points and one exact hit
+    changes = defaultdict(list)
+    for (group_id, user_id), difference in delta.items():
+        if any(difference):
+            changes[(group_id, *difference)].append(user_id)
+    for (group_id, points, exact_hits, outcome_hits), user_ids in changes.items():
+        Standing.objects.filter(group_id=group_id, user_id__in=user_ids).update(
+            points=F('points') + points,
+            exact_hits=F('exact_hits') + exact_hits,
+            outcome_hits=F('outcome_hits') + outcome_hits,
+        )
+    # the group detail shows the members' points
+    for group_id in {group_id for group_id, _, _, _ in changes}:
+        cache.invalidate_on_commit('group', group_id)
+
+
+def add_totals(delta, bets, sign):
+    for row in standing_totals(bets):
+        totals = delta[(row['event__group'], row['user'])]
+        totals[0] += sign * row['points_total']
+        totals[1] += sign * row['exact_total']
+        totals[2] += sign * row['outcome_total']
+
+
+def update_standings(event, sign):
+    """Adds (sign=1) or removes (sign=-1) the scored bets of an event to the standings."""
+    score1, score2 = int(event.score1), int(event.score2)
+    scored = Bet.objects.filter(event=event, points__isnull=False)
+    bet = scored.filter(user=OuterRef('user'))
+    cache.invalidate_on_commit('group', event.group_id)
+    exact = exact_filter(score1, score2)
+
+    return Standing.objects.filter(
+        group_id=event.group_id, user__in=scored.values('user')
+    ).update(
+        points=F('points') + sign * Coalesce(Subquery(bet.values('points')[:1]), 0),
+        exact_hits=F('exact_hits') + Case(
+            When(Exists(bet.filter(exact)), then=Value(sign)), default=Value(0)
+        ),
+        outcome_hits=F('outcome_hits') + Case(
+            When(Exists(bet.filter(outcome_filter(score1, score2)).exclude(exact)), then=Value(sign)),
+            default=Value(0),
+        ),
+    )
+
+
+def standing_totals(bets):
+    """Per (group, user) totals of the given bets, the from-scratch version of the standings."""
+    exact = Q(score1=F('event__score1'), score2=F('event__score2'))
+    outcome = (
+        Q(score1__gt=F('score2'), event__score1__gt=F('event__score2'))
+        | Q(score1__lt=F('score2'), event__score1__lt=F('event__score2'))
+        | Q(score1=F('score2'), event__score1=F('event__score2'))
+    )
+    return (
+        bets.filter(points__isnull=False, event__score1__isnull=False, event__score2__isnull=False)
+        .values('event__group', 'user')
+        .annotate(
+            points_total=Sum('points'),
+            exact_total=Count('id', filter=exact),
+            outcome_total=Count('id', filter=outcome & ~exact),
+        )
+        .order_by()
+    )
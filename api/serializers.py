@@ -1,8 +1,12 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
-from api.models import Group, Event, UserProfile, Member, Comment, Bet
-from django.db.models import Sum
+from api.models import Group, Event, UserProfile, Member, Comment, Bet, Standing
+from api.metrics import TimedSerializerMixin
+from api.sparse import SparseFieldsMixin
+from api import payloads
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 class ChangePasswordSerializer(serializers.Serializer):
@@ -10,12 +14,17 @@ class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = UserProfile
-        fields = ('id','image', 'is_premium', 'bio')
+        fields = ('id','image', 'is_premium', 'bio', 'image_variants')
+
+    def get_image_variants(self, obj):
+        return payloads.variant_urls(obj.image.name, obj.image_variants, self.context.get('request'))
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     profile = UserProfileSerializer()
     class Meta:
         model = User
@@ -32,19 +41,19 @@ class UserSerializer(serializers.ModelSerializer):
         Token.objects.create(user=user)
         return user
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = ('id', 'team1', 'team2', 'time', 'group')
 
-class BetSerializer(serializers.ModelSerializer):
+class BetSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False)
     class Meta:
         model = Bet
         fields = ('id','user', 'event', 'score1', 'score2', 'points')
 
-class EventFullSerializer(serializers.ModelSerializer):
-    bets = BetSerializer(many=True)
+class EventFullSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    bets = serializers.SerializerMethodField()
     is_admin = serializers.SerializerMethodField()
     num_bets = serializers.SerializerMethodField()
 
@@ -52,22 +61,31 @@ class EventFullSerializer(serializers.ModelSerializer):
         model = Event
         fields = ('id', 'team1', 'team2', 'time', 'score1', 'score2', 'group', 'bets', 'is_admin', 'num_bets')
 
+    # EventViewSet annotates/prefetches bets_total, admin_flag and visible_bets,
+    # the queries below are only the fallback for events loaded elsewhere
+
     def get_num_bets(self, obj):
+        if hasattr(obj, 'bets_total'):
+            return obj.bets_total
         no_bets  = Bet.objects.filter(event=obj).count()
         return no_bets
 
     def get_bets(self, obj):
-        if obj.time < timezone.now():
-            bets = Bet.objects.filter(event=obj)
+        if hasattr(obj, 'visible_bets'):
+            bets = obj.visible_bets
+        elif obj.time < timezone.now():
+            bets = Bet.objects.filter(event=obj).select_related('user__profile')
         else:
             user = self.context['request'].user
-            bets = Bet.objects.filter(event=obj, user=user)
+            bets = Bet.objects.filter(event=obj, user=user).select_related('user__profile')
         
-        serializer = BetSerializer(bets, many=True)
+        serializer = BetSerializer(bets, many=True, context=self.context)
         return serializer.data
         
     
     def get_is_admin(self, obj):
+        if hasattr(obj, 'admin_flag'):
+            return obj.admin_flag
         user = self.context['request'].user
         try:
             member = Member.objects.get(group=obj.group, user=user)
@@ -75,23 +93,31 @@ class EventFullSerializer(serializers.ModelSerializer):
         except:
             return None
     
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ('user', 'group', 'description', 'time')
 
-class MemberSerializer(serializers.ModelSerializer):
+class MemberSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False)
     class Meta:
         model = Member
         fields = ('user', 'group', 'admin')
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    num_members = serializers.SerializerMethodField()
+
     class Meta:
         model = Group
         fields = ('id', 'name', 'location', 'description', 'num_members')
 
-class GroupFullSerializer(serializers.ModelSerializer):
+    def get_num_members(self, obj):
+        # GroupViewSet.list annotates the count, fall back to a query otherwise
+        if hasattr(obj, 'members_total'):
+            return obj.members_total
+        return obj.num_members()
+
+class GroupFullSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     events = EventSerializer(many=True, read_only=True)
 
     #members = MemberSerializer(many=True, read_only=True)
@@ -104,20 +130,35 @@ class GroupFullSerializer(serializers.ModelSerializer):
         model = Group
         fields = ('id', 'name', 'location', 'description', 'events', 'members', 'comments')
 
+    # members and comments are built from .values() rows by api/payloads.py,
+    # a serializer per row costs more than the queries for large groups
+
     def get_comments(self, obj):
-        comments = Comment.objects.filter(group=obj).order_by('-time')
-        serializer = CommentSerializer(comments, many=True)
-        return serializer.data
+        comments = Comment.objects.filter(group=obj).order_by('-time').values(*payloads.COMMENT_VALUES)
+        return [payloads.comment(row) for row in comments]
 
     def get_members(self, obj):
-        people_points = []
-        members = obj.members.all()
-        for member in members:
-            points = Bet.objects.filter(event__group=obj, user=member.user.id).aggregate(pts=Sum('points'))
-            member_serialized = MemberSerializer(member, many=False)
-            member_data = member_serialized.data
-            member_data['points'] = points['pts'] or 0
+        standing = Standing.objects.filter(group=obj, user=OuterRef('user'))
+        members = (
+            obj.members.annotate(points=Coalesce(Subquery(standing.values('points')[:1]), 0))
+            .order_by('-points', 'id')
+            .values(*payloads.MEMBER_VALUES)
+        )
+
+        request = self.context.get('request')
+        if request is not None:
+            offset = self._int_param(request, 'offset')
+            limit = self._int_param(request, 'limit')
+            if offset:
+                members = members[offset:] if limit is None else members[offset:offset + limit]
+            elif limit is not None:
+                members = members[:limit]
 
-            people_points.append(member_data)
+        return [payloads.member(row) for row in members]
 
-        return people_points
\ No newline at end of file
+    def _int_param(self, request, name):
+        try:
+            value = int(request.query_params[name])
+        except (KeyError, ValueError):
+            return None
+        return value if value >= 0 else None
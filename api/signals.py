@@ -0,0 +1,143 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import avatars, cache, scoring
+from api.authentication import revoke_token, token_cache
+from api.models import UserProfile, Group, Event, Member, Comment, Bet, Tombstone
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    cache.invalidate_on_commit("group", instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Event)
+def event_changed(sender, instance, **kwargs):
+    cache.invalidate_on_commit("event", instance.pk)
+    cache.invalidate_on_commit("group", instance.group_id)
+
+
+@receiver([post_save, post_delete], sender=Member)
+def member_changed(sender, instance, **kwargs):
+    # also covers the is_admin flag of the group's events
+    cache.invalidate_on_commit("group", instance.group_id)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    cache.invalidate_on_commit("group", instance.group_id)
+
+
+@receiver([post_save, post_delete], sender=Bet)
+def bet_changed(sender, instance, **kwargs):
+    cache.invalidate_on_commit("event", instance.event_id)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance, **kwargs):
+    revoke_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # password changes, deactivation etc.
+    for key in Token.objects.filter(user_id=instance.pk).values_list("key", flat=True):
+        revoke_token(key)
+    transaction.on_commit(lambda: token_cache.discard_user(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # saves of other fields (last_login) do not show in group or event details
+    if update_fields is None or {"username", "email"} & set(update_fields):
+        cache.invalidate_user_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    cache.invalidate_user_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, raw=False, **kwargs):
+    # a new upload, its variants are built in the background
+    if not raw and instance.image and instance.image.name != instance.image_variants.get("source"):
+        avatars.schedule(instance)
+
+
+def origin_model(origin):
+    # the model whose delete() started the cascade
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def count_members_on_commit(group_id, delta):
+    # F() so concurrent joins and leaves add up
+    transaction.on_commit(
+        lambda: Group.objects.filter(pk=group_id).update(member_count=F("member_count") + delta)
+    )
+
+
+@receiver(post_save, sender=Member)
+def member_saved(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        count_members_on_commit(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, origin=None, **kwargs):
+    # a deleted group takes its counter along
+    if origin_model(origin) is not Group:
+        count_members_on_commit(instance.group_id, -1)
+
+
+@receiver(pre_delete, sender=Event)
+def event_deleting(sender, instance, origin=None, **kwargs):
+    # standings of a deleted group go with it
+    if instance.score1 is not None and instance.score2 is not None and origin_model(origin) is not Group:
+        scoring.take_back(Bet.objects.filter(event=instance))
+
+
+@receiver(pre_delete, sender=Bet)
+def bet_deleting(sender, instance, origin=None, **kwargs):
+    # bets deleted with their event are taken back above, standings of a
+    # deleted user or group go with them
+    if instance.points is not None and origin_model(origin) is Bet:
+        scoring.take_back(Bet.objects.filter(pk=instance.pk))
+
+
+@receiver(pre_delete, sender=Event)
+@receiver(pre_delete, sender=Member)
+@receiver(pre_delete, sender=Comment)
+@receiver(pre_delete, sender=Bet)
+def collect_tombstone(sender, instance, origin=None, **kwargs):
+    # rows removed along with their group or event need no tombstone of their own
+    model = origin_model(origin)
+    if model is Group or (model is Event and sender is not Event):
+        return
+    # every pre_delete of a cascade comes before its first post_delete,
+    # write_tombstones() inserts them all at once
+    target = instance if origin is None else origin
+    target.__dict__.setdefault("_tombstones", []).append((sender, instance))
+
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Member)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Bet)
+def write_tombstones(sender, instance, origin=None, **kwargs):
+    target = instance if origin is None else origin
+    pending = target.__dict__.pop("_tombstones", None)
+    if not pending:
+        return
+    event_ids = {deleted.event_id for model, deleted in pending if model is Bet}
+    event_groups = dict(Event.objects.filter(pk__in=event_ids).values_list("pk", "group_id")) if event_ids else {}
+    tombstones = []
+    for model, deleted in pending:
+        group_id = event_groups.get(deleted.event_id) if model is Bet else deleted.group_id
+        if group_id is not None:
+            tombstones.append(Tombstone(group_id=group_id, model=model.__name__.lower(), object_id=deleted.pk))
+    Tombstone.objects.bulk_create(tombstones, batch_size=1000)
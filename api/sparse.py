@@ -0,0 +1,64 @@
+"""
+Sparse fieldsets for read requests. ?fields=id,score1 keeps only the
+named fields; ?expand=user keeps the named nested objects and reduces
+every other nested object to its primary key, so ?expand= alone skips
+all of them. Without the parameters responses are unchanged.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def names(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def parse(query_params):
+    """fields and expand keyword arguments for SparseFieldsMixin and prune()."""
+    params = {}
+    if query_params.get("fields"):
+        params["fields"] = names(query_params["fields"])
+    if "expand" in query_params:
+        params["expand"] = names(query_params["expand"])
+    return params
+
+
+def prune(data, fields=None, expand=None):
+    """The same as SparseFieldsMixin for a payload dict from api/payloads.py."""
+    if fields is not None:
+        data = {name: value for name, value in data.items() if name in fields}
+    if expand is not None:
+        for name, value in data.items():
+            if isinstance(value, dict) and name not in expand:
+                data[name] = value["id"]
+    return data
+
+
+class SparseFieldsMixin:
+    """Serializer side of the sparse fieldsets, takes fields= and expand= arguments."""
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.sparse_fields = fields
+        self.sparse_expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is not None:
+            for name in set(fields) - self.sparse_fields:
+                del fields[name]
+        if self.sparse_expand is not None:
+            for name, field in fields.items():
+                if name in self.sparse_expand or not isinstance(field, serializers.BaseSerializer):
+                    continue
+                many = isinstance(field, serializers.ListSerializer)
+                fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True, source=field.source)
+        return fields
+
+
+class SparseFieldsViewMixin:
+    """Passes ?fields= and ?expand= of read requests on to the serializer."""
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method in SAFE_METHODS:
+            kwargs.update(parse(self.request.query_params))
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,82 @@
+import asyncio
+import secrets
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+
+from api import cache
+from api.authentication import aauthenticate
+from api.broker import broker
+from api.models import Group
+
+
+def _ticket_key(ticket):
+    return "bwf:stream-ticket:{}".format(ticket)
+
+
+def issue_ticket(user, group_id):
+    """
+    A single-use ticket for opening the group's stream within
+    settings.API_STREAM_TICKET_TTL seconds. EventSource cannot send an
+    Authorization header and a ?token= would end up in access logs.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.get_cache().set(_ticket_key(ticket), (user.pk, group_id), timeout=settings.API_STREAM_TICKET_TTL)
+    return ticket
+
+
+async def redeem_ticket(ticket, group_id):
+    """True if the ticket was issued to an active user for this group, it can not be used again."""
+    key = _ticket_key(ticket)
+    issued = await cache.get_cache().aget(key)
+    # only the request that deletes it may use it
+    if issued is None or not await cache.get_cache().adelete(key):
+        return False
+    user_id, ticket_group_id = issued
+    return ticket_group_id == group_id and await User.objects.filter(pk=user_id, is_active=True).aexists()
+
+
+async def group_stream(request, pk):
+    """
+    Server-Sent Events of a group: comment_created, bet_placed and
+    event_scored. Authenticated by a ?ticket= from the group's stream_ticket
+    action or an Authorization header. Only served under ASGI (bwf/asgi.py),
+    a WSGI worker would have to buffer the endless response.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"message": "Streaming requires the ASGI server"}, status=501)
+    if "ticket" in request.GET:
+        authenticated = await redeem_ticket(request.GET["ticket"], pk)
+    else:
+        try:
+            authenticated = (await aauthenticate(request)).is_authenticated
+        except exceptions.AuthenticationFailed:
+            authenticated = False
+    if not authenticated:
+        return JsonResponse({"message": "Authentication required"}, status=401)
+    if not await Group.objects.filter(pk=pk).aexists():
+        return JsonResponse({"message": "Not found"}, status=404)
+
+    subscription = broker.subscribe(pk)
+
+    async def messages():
+        try:
+            yield "retry: {}\n\n".format(settings.API_STREAM_RETRY_MS).encode()
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), settings.API_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(messages(), content_type="text/event-stream")
+    # a closed response may have stopped in Django's wrapper around
+    # messages(), a cancelled one runs the finally above
+    response._resource_closers.append(lambda: broker.unsubscribe(subscription))
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
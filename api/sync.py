@@ -0,0 +1,71 @@
+"""
+Delta sync of a group: everything created, updated or deleted since a
+cursor. Cursors are opaque to clients, internally they are microseconds
+since the epoch, moved back by API_SYNC_OVERLAP so rows committed by a
+transaction that started before the read are picked up by the next call.
+Clients apply changes as upserts, seeing a row twice is harmless.
+Tombstones are kept for API_SYNC_TOMBSTONE_DAYS (prune_tombstones), older
+cursors are refused and the client starts over without one.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import Event, Member, Comment, Bet, Tombstone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(moment):
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def retention_start():
+    """Deletions before this moment may be pruned, see prune_tombstones."""
+    return timezone.now() - timedelta(days=settings.API_SYNC_TOMBSTONE_DAYS)
+
+
+def decode_cursor(cursor):
+    """Returns the datetime of a cursor, raises ValueError for garbage."""
+    if not cursor:
+        return EPOCH
+    return EPOCH + timedelta(microseconds=int(cursor))
+
+
+def group_changes(group, user, since):
+    now = timezone.now()
+    visible_bets = Q(event__time__lt=now) | Q(user=user)
+    # other users' bets become visible at kickoff, however old they are
+    changed_bets = Q(updated_at__gte=since) | Q(event__time__gte=since, event__time__lt=now)
+
+    deleted = {}
+    tombstones = Tombstone.objects.filter(group=group, deleted_at__gte=since)
+    for model, object_id in tombstones.values_list("model", "object_id"):
+        deleted.setdefault(model, []).append(object_id)
+
+    return {
+        "cursor": encode_cursor(now - timedelta(seconds=settings.API_SYNC_OVERLAP)),
+        "events": list(
+            Event.objects.filter(group=group, updated_at__gte=since).values(
+                "id", "team1", "team2", "time", "score1", "score2"
+            )
+        ),
+        "members": list(
+            Member.objects.filter(group=group, updated_at__gte=since).values(
+                "id", "user", "admin", username=F("user__username")
+            )
+        ),
+        "comments": list(
+            Comment.objects.filter(group=group, updated_at__gte=since).values(
+                "id", "user", "description", "time"
+            )
+        ),
+        "bets": list(
+            Bet.objects.filter(visible_bets, changed_bets, event__group=group).values(
+                "id", "event", "user", "score1", "score2", "points"
+            )
+        ),
+        "deleted": deleted,
+    }
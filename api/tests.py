@@ -1,3 +1,1130 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import async_views, avatars, leaderboard, sync
+from api import urls as api_urls
+from api import cache as response_cache
+from api.authentication import password_verifier, token_cache
+from api.broker import Broker, broker
+from api.db import ReadReplicaRouter
+from api.metrics import route_stats
+from api.payloads import format_datetime
+from api.models import Group, Member, Event, Comment, Bet, Standing, Tombstone, UserProfile
+from api.scoring import record_result, standing_totals
+from api.serializers import BetSerializer
+from bwf import serve
+
+
+class GroupListTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [
+            User.objects.create_user(username="user{}".format(i)) for i in range(5)
+        ]
+
+    def create_groups(self, count):
+        for i in range(count):
+            group = Group.objects.create(
+                name="group{}-{}".format(count, i), location="loc", description="desc"
+            )
+            for user in self.users[: i % len(self.users) + 1]:
+                Member.objects.create(group=group, user=user)
+
+    def test_list_query_count_does_not_grow_with_groups(self):
+        self.create_groups(2)
+        with self.assertNumQueries(1):
+            self.client.get("/api/groups/")
+
+        self.create_groups(20)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/groups/")
+
+        self.assertEqual(len(response.data["results"]), 22)
+        for item in response.data["results"]:
+            group = Group.objects.get(pk=item["id"])
+            self.assertEqual(item["num_members"], group.num_members())
+
+    def test_join_and_leave_keep_member_count(self):
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        data = {"group": group.id, "user": self.users[0].id}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/members/join/", data)
+        group.refresh_from_db()
+        self.assertEqual(group.member_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/members/leave/", data)
+        group.refresh_from_db()
+        self.assertEqual(group.member_count, 0)
+
+    def test_every_member_change_keeps_member_count(self):
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users[:3]:
+                Member.objects.create(group=group, user=user)
+            Member.objects.filter(user=self.users[0]).delete()
+            self.users[1].delete()
+        group.refresh_from_db()
+        self.assertEqual(group.member_count, Member.objects.filter(group=group).count())
+        self.assertEqual(group.member_count, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                group.delete()
+        self.assertFalse([query for query in queries if "member_count" in query["sql"]])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="reader")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.create(user=user).key)
+        Group.objects.bulk_create(
+            Group(name="group{}".format(i), location="loc", description="desc") for i in range(205)
+        )
+        group = Group.objects.first()
+        Comment.objects.bulk_create(
+            Comment(user=user, group=group, description=str(i)) for i in range(205)
+        )
+
+    def follow(self, url):
+        results = []
+        while url:
+            response = self.client.get(url)
+            self.assertFalse(response.streaming)
+            results += response.json()["results"]
+            url = response.json()["next"]
+        return results
+
+    def test_long_pages_are_streamed(self):
+        for route in ("/api/groups/", "/api/comments/"):
+            response = self.client.get(route + "?page_size=200")
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Type"], "application/json")
+            page = json.loads(b"".join(response.streaming_content))
+            self.assertIsNone(page["previous"])
+
+            rest = self.follow(page["next"])
+            self.assertEqual(len(rest), 5)
+            self.assertEqual(page["results"] + rest, self.follow(route + "?page_size=100"))
+
+    def test_cursor_pages_cover_the_list_once(self):
+        groups = self.follow("/api/groups/?page_size=50")
+        expected = Group.objects.order_by("id").values_list("id", flat=True)
+        self.assertEqual([group["id"] for group in groups], list(expected))
+        comments = self.follow("/api/comments/?page_size=50")
+        expected = Comment.objects.order_by("-time", "-id").values_list("description", flat=True)
+        self.assertEqual([comment["description"] for comment in comments], list(expected))
+
+    def test_browsable_api_is_not_streamed(self):
+        response = self.client.get("/api/comments/?page_size=200&format=api")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/html; charset=utf-8")
+
+
+class PlaceBetConcurrencyTests(TransactionTestCase):
+    databases = {"default", *settings.SQLITE_READ_REPLICAS}
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("threads lock whole tables of the in-memory SQLite test database")
+        self.user = User.objects.create_user(username="better")
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        Member.objects.create(group=group, user=self.user)
+        self.event = Event.objects.create(
+            team1="a", team2="b", time=timezone.now() + timedelta(hours=1), group=group
+        )
+
+    def place_bet(self, score):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            return client.post(
+                "/api/bets/place_bet/",
+                {"event": self.event.id, "score1": score, "score2": 0},
+            )
+        finally:
+            connection.close()
+
+    def test_parallel_place_bet_keeps_one_bet(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(self.place_bet, range(32)))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(sum(response.data["new"] for response in responses), 1)
+        bet = Bet.objects.get(user=self.user, event=self.event)
+        self.assertIn(bet.score1, range(32))
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite syntax")
+class QueryPlanTests(TestCase):
+    """The hot queries must search an index, never scan a whole table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="planner")
+        cls.group = Group.objects.create(name="g", location="loc", description="desc")
+        cls.event = Event.objects.create(team1="a", team2="b", time=timezone.now(), group=cls.group)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertSearches(self, queryset, ordered=False):
+        plan = self.query_plan(queryset)
+        scans = [step for step in plan if step.startswith("SCAN api_")]
+        self.assertEqual(scans, [], "full table scan in {}".format(plan))
+        if ordered:
+            self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_group_events_by_time(self):
+        self.assertSearches(Event.objects.filter(group=self.group).order_by("time"), ordered=True)
+
+    def test_group_comments_by_time(self):
+        self.assertSearches(Comment.objects.filter(group=self.group).order_by("-time"), ordered=True)
+
+    def test_group_standings_by_points(self):
+        self.assertSearches(Standing.objects.filter(group=self.group).order_by("-points"), ordered=True)
+
+    def test_group_members_with_points(self):
+        standing = Standing.objects.filter(group=self.group, user=OuterRef("user"))
+        members = Member.objects.filter(group=self.group).annotate(
+            points=Subquery(standing.values("points")[:1])
+        )
+        self.assertSearches(members)
+
+    def test_membership_check(self):
+        self.assertSearches(Member.objects.filter(group=self.group, user=self.user))
+
+    def test_scored_bets_of_event(self):
+        bets = Bet.objects.filter(event=self.event, points__isnull=False)
+        plan = self.query_plan(bets.values("user", "points"))
+        self.assertTrue(any("COVERING INDEX" in step for step in plan), plan)
+
+    def test_group_standing_totals(self):
+        self.assertSearches(standing_totals(Bet.objects.filter(event__group=self.group)))
+
+    def test_group_changes(self):
+        since = timezone.now()
+        for model in (Event, Member, Comment):
+            self.assertSearches(model.objects.filter(group=self.group, updated_at__gte=since))
+        self.assertSearches(Bet.objects.filter(event=self.event, updated_at__gte=since))
+        self.assertSearches(Tombstone.objects.filter(group=self.group, deleted_at__gte=since))
+
+
+class StandingsAssertions:
+    def assertStandingsMatchBets(self):
+        # all-zero totals are the same as no row
+        expected = {
+            row["user"]: (row["points_total"], row["exact_total"], row["outcome_total"])
+            for row in standing_totals(Bet.objects.filter(event__group=self.group))
+            if row["points_total"] or row["exact_total"] or row["outcome_total"]
+        }
+        stored = {
+            user_id: tuple(totals)
+            for user_id, *totals in Standing.objects.filter(group=self.group).values_list(
+                "user_id", "points", "exact_hits", "outcome_hits"
+            )
+            if any(totals)
+        }
+        self.assertEqual(stored, expected)
+
+
+class StandingsTests(StandingsAssertions, TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name="g", location="loc", description="desc")
+        self.players = [User.objects.create_user(username="player{}".format(i)) for i in range(4)]
+        self.events = [
+            Event.objects.create(team1="a", team2="b", time=timezone.now() - timedelta(hours=i + 1), group=self.group)
+            for i in range(2)
+        ]
+        for event in self.events:
+            Bet.objects.bulk_create(
+                Bet(event=event, user=user, score1=i % 3, score2=1) for i, user in enumerate(self.players)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.players[0])
+        for event in self.events:
+            self.client.put("/api/events/{}/set_result/".format(event.id), {"score1": 2, "score2": 1})
+
+    def test_deleting_a_scored_bet_takes_back_its_points(self):
+        self.assertTrue(Standing.objects.filter(group=self.group, points__gt=0).exists())
+        bet = Bet.objects.filter(points__gt=0).first()
+        self.client.delete("/api/bets/{}/".format(bet.id))
+        self.assertStandingsMatchBets()
+
+    def test_deleting_a_scored_bet_changes_the_group_etag(self):
+        response_cache.get_cache().clear()
+        bet = Bet.objects.filter(points__gt=0).first()
+        Member.objects.create(group=self.group, user=bet.user)
+        url = "/api/groups/{}/".format(self.group.id)
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete("/api/bets/{}/".format(bet.id))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        points = Standing.objects.get(group=self.group, user=bet.user).points
+        self.assertEqual(response.json()["members"][0]["points"], points)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_deleting_a_scored_event_takes_back_its_bets(self):
+        self.client.delete("/api/events/{}/".format(self.events[0].id))
+        self.assertStandingsMatchBets()
+
+    def test_result_correction_uses_the_stored_result(self):
+        # a stale copy of the event, as a concurrent request would hold it
+        stale = Event.objects.get(pk=self.events[0].pk)
+        stale.score1 = stale.score2 = None
+        record_result(stale, 0, 0)
+        self.assertStandingsMatchBets()
+
+
+class ScheduleImportTests(StandingsAssertions, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin")
+        self.group = Group.objects.create(name="g", location="loc", description="desc", scoring="goal_difference")
+        Member.objects.create(group=self.group, user=self.admin, admin=True)
+        self.players = [User.objects.create_user(username="player{}".format(i)) for i in range(6)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.start = timezone.now() - timedelta(days=1)
+
+    def schedule(self, count):
+        return [
+            {"group": self.group.id, "team1": "home{}".format(i), "team2": "away",
+             "time": (self.start + timedelta(hours=i)).isoformat()}
+            for i in range(count)
+        ]
+
+    def test_import_skips_existing_and_repeated_rows(self):
+        rows = self.schedule(5)
+        response = self.client.post("/api/events/import/", rows + rows[:1], format="json")
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]], ["created"] * 5 + ["duplicate"]
+        )
+
+        response = self.client.post("/api/events/import/", {"events": self.schedule(7)}, format="json")
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]], ["existing"] * 5 + ["created"] * 2
+        )
+        self.assertEqual(Event.objects.filter(group=self.group).count(), 7)
+
+    def test_import_needs_group_admin(self):
+        other = APIClient()
+        other.force_authenticate(self.players[0])
+        response = other.post("/api/events/import/", self.schedule(2), format="json")
+        self.assertEqual([result["status"] for result in response.data["results"]], ["forbidden"] * 2)
+        self.assertFalse(Event.objects.exists())
+
+    def test_batch_results_match_bet_history(self):
+        self.client.post("/api/events/import/", self.schedule(8), format="json")
+        events = list(Event.objects.filter(group=self.group).order_by("time"))
+        for i, event in enumerate(events):
+            Bet.objects.bulk_create(
+                Bet(event=event, user=user, score1=(i + j) % 3, score2=j % 2) for j, user in enumerate(self.players)
+            )
+
+        results = [{"event": event.id, "score1": i % 3, "score2": i % 2} for i, event in enumerate(events)]
+        response = self.client.post("/api/events/results/", {"results": results}, format="json")
+        self.assertEqual([result["status"] for result in response.data["results"]], ["scored"] * 8)
+        self.assertStandingsMatchBets()
+
+        # corrections take back what the first results contributed
+        results = [{"event": event.id, "score1": 1, "score2": i % 4} for i, event in enumerate(events[:5])]
+        self.client.post("/api/events/results/", {"results": results}, format="json")
+        self.assertStandingsMatchBets()
+
+
+class GroupMembersTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name="g", location="loc", description="desc")
+        # members come by points, highest first
+        self.usernames = ["p{}".format(points) for points in (9, 7, 5, 3, 1)]
+        for username in reversed(self.usernames):
+            user = User.objects.create_user(username=username)
+            Member.objects.create(group=self.group, user=user)
+            Standing.objects.create(group=self.group, user=user, points=int(username[1:]))
+
+    def members(self, query=""):
+        response = self.client.get("/api/groups/{}/{}".format(self.group.id, query))
+        self.assertEqual(response.status_code, 200)
+        return [member["user"]["username"] for member in response.json()["members"]]
+
+    def test_defaults(self):
+        self.assertEqual(self.members(), self.usernames)
+        self.assertEqual(self.members("?limit=100"), self.usernames)
+
+    def test_limit_and_offset(self):
+        self.assertEqual(self.members("?limit=2"), self.usernames[:2])
+        self.assertEqual(self.members("?offset=3"), self.usernames[3:])
+        self.assertEqual(self.members("?offset=1&limit=2"), self.usernames[1:3])
+        self.assertEqual(self.members("?limit=0"), [])
+        self.assertEqual(self.members("?offset=5"), [])
+        self.assertEqual(self.members("?offset=10&limit=2"), [])
+
+    def test_invalid_values_are_ignored(self):
+        for query in ("?limit=ten", "?offset=x", "?limit=-2", "?offset=-1", "?limit=", "?offset=1.5"):
+            self.assertEqual(self.members(query), self.usernames, query)
+        self.assertEqual(self.members("?offset=-1&limit=2"), self.usernames[:2])
+        self.assertEqual(self.members("?offset=2&limit=-1"), self.usernames[2:])
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="better")
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        Member.objects.create(group=group, user=self.user)
+        event = Event.objects.create(team1="a", team2="b", time=timezone.now(), group=group)
+        Bet.objects.create(event=event, user=self.user, score1=1, score2=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bet_list_rows_match_serializer(self):
+        response = self.client.get("/api/bets/")
+        request = response.wsgi_request
+        expected = BetSerializer(Bet.objects.all(), many=True, context={"request": request}).data
+        self.assertEqual(response.json()["results"], expected)
+
+    def test_fields_and_expand(self):
+        for url in ("/api/bets/?fields=id,user&expand=", "/api/members/?fields=id,user&expand="):
+            results = self.client.get(url).json()["results"]
+            self.assertEqual(results[0]["user"], self.user.id)
+            self.assertLessEqual(set(results[0]), {"id", "user"})
+
+        results = self.client.get("/api/members/?fields=user&expand=user").json()["results"]
+        self.assertEqual(results[0]["user"]["username"], "better")
+
+    def test_detail_fields_and_expand(self):
+        group = Group.objects.get()
+        event = Event.objects.get()
+
+        data = self.client.get("/api/groups/{}/?fields=id,events&expand=".format(group.id)).json()
+        self.assertEqual(data, {"id": group.id, "events": [event.id]})
+        self.assertIn("members", self.client.get("/api/groups/{}/".format(group.id)).json())
+
+        full = self.client.get("/api/events/{}/".format(event.id))
+        sparse_response = self.client.get("/api/events/{}/?fields=id,num_bets".format(event.id))
+        self.assertEqual(sparse_response.json(), {"id": event.id, "num_bets": 1})
+        self.assertNotEqual(sparse_response["ETag"], full["ETag"])
+        self.assertIn("bets", self.client.get("/api/events/{}/".format(event.id)).json())
+
+
+@override_settings(API_METRICS_SAMPLE_RATE=1)
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="admin", is_staff=True)
+        route_stats.clear()
+
+    def queries(self, response):
+        return int(re.search(r'desc="(\d+) queries"', response["Server-Timing"]).group(1))
+
+    async def test_async_requests_count_their_queries(self):
+        sync_response = await sync_to_async(self.client.get)("/api/users/")
+        async_response = await AsyncClient().get("/api/users/")
+        self.assertGreater(self.queries(sync_response), 0)
+        self.assertEqual(self.queries(async_response), self.queries(sync_response))
+
+    def test_streaming_body_queries_count_on_close(self):
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        Event.objects.create(team1="a", team2="b", time=timezone.now(), group=group)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get("/api/groups/{}/export/".format(group.id))
+        self.assertNotIn("group-export", route_stats.snapshot())
+        b"".join(response.streaming_content)
+
+        stats = route_stats.snapshot()["group-export"]
+        self.assertGreater(stats["avg_queries"], self.queries(response))
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="holder")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        token_cache.clear()
+
+    def assertRevokedEverywhere(self, change):
+        self.assertEqual(self.client.get("/api/events/").status_code, 200)
+        # the entry another worker holds, it never sees this process' discard()
+        entries = dict(token_cache._entries)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        token_cache._entries.update(entries)
+        self.assertEqual(self.client.get("/api/events/").status_code, 401)
+
+    def test_deleted_token_is_refused_by_other_workers(self):
+        self.assertRevokedEverywhere(self.token.delete)
+
+    def test_deactivated_user_is_refused_by_other_workers(self):
+        def deactivate():
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertRevokedEverywhere(deactivate)
+
+
+class TombstoneTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="leaver")
+        self.groups = [Group.objects.create(name="g{}".format(i), location="loc", description="desc") for i in range(2)]
+        for group in self.groups:
+            Member.objects.create(group=group, user=self.user)
+            Comment.objects.create(group=group, user=self.user, description="hi")
+            for i in range(3):
+                event = Event.objects.create(team1="a", team2="b", time=timezone.now(), group=group)
+                Bet.objects.create(event=event, user=self.user, score1=i, score2=0)
+
+    def test_cascade_writes_tombstones_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "api_tombstone"')]
+        self.assertEqual(len(inserts), 1)
+        for group in self.groups:
+            counts = Counter(Tombstone.objects.filter(group=group).values_list("model", flat=True))
+            self.assertEqual(counts, {"member": 1, "comment": 1, "bet": 3})
+
+    def test_group_delete_leaves_no_tombstones(self):
+        self.groups[0].delete()
+        Group.objects.filter(pk=self.groups[1].pk).delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_expired_cursor_and_pruning(self):
+        Comment.objects.filter(group=self.groups[0]).delete()
+        old = timezone.now() - timedelta(days=settings.API_SYNC_TOMBSTONE_DAYS + 1)
+        Tombstone.objects.update(deleted_at=old)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = "/api/groups/{}/changes/?since={}".format(self.groups[0].id, sync.encode_cursor(old))
+        self.assertEqual(client.get(url).status_code, 410)
+
+        call_command("prune_tombstones", stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+def jpeg_with_exif(width, height):
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    # rotate 90 degrees clockwise for display
+    exif[0x0112] = 6
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, "JPEG", exif=exif.tobytes())
+    return output.getvalue()
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, API_AVATAR_WORKERS=0))
+        self.user = User.objects.create_user(username="pictured")
+
+    def upload(self, run_on_commit=True):
+        with self.captureOnCommitCallbacks(execute=run_on_commit):
+            return UserProfile.objects.create(
+                user=self.user, image=SimpleUploadedFile("me.jpg", jpeg_with_exif(40, 20))
+            )
+
+    def test_upload_is_stripped_rotated_and_resized(self):
+        uploaded = self.upload().image.name
+        profile = UserProfile.objects.get(user=self.user)
+
+        self.assertNotEqual(profile.image.name, uploaded)
+        self.assertFalse(default_storage.exists(uploaded))
+        with default_storage.open(profile.image.name) as file:
+            image = Image.open(file)
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(dict(image.getexif()), {})
+
+        self.assertEqual(profile.image_variants["source"], profile.image.name)
+        for size in settings.API_AVATAR_SIZES:
+            with default_storage.open(profile.image_variants[str(size)]) as file:
+                image = Image.open(file)
+                self.assertEqual((image.format, image.size), ("WEBP", (size, size)))
+
+    def test_image_replaced_meanwhile_is_kept(self):
+        profile = self.upload(run_on_commit=False)
+        variants = avatars.build_variants(profile.image.name)
+        UserProfile.objects.filter(pk=profile.pk).update(image="avatars/other.jpg")
+
+        self.assertFalse(avatars.save_variants(profile.pk, profile.image.name, variants, {}))
+        self.assertTrue(default_storage.exists(profile.image.name))
+        for name in variants.values():
+            self.assertFalse(default_storage.exists(name))
+
+
+class ImportUsersTests(TransactionTestCase):
+    # not a TestCase, the command closes the connections before forking its hashing pool
+
+    def test_rows_of_the_wrong_type_are_invalid(self):
+        rows = [
+            {"username": "imported", "password": "secret", "bio": "hi", "is_premium": True},
+            ["imported2", "secret"],
+            42,
+            {"username": 7, "password": "secret"},
+            {"username": "imported3", "password": 1234},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as source:
+            source.write("\n".join(json.dumps(row) for row in rows))
+            source.flush()
+            output = io.StringIO()
+            call_command("import_users", source.name, "--workers", "1", stdout=output)
+
+        self.assertIn("5 rows read, 1 created, 0 existing, 4 invalid", output.getvalue())
+        user = User.objects.get()
+        self.assertTrue(user.check_password("secret"))
+        self.assertEqual((user.profile.bio, user.profile.is_premium), ("hi", True))
+        self.assertTrue(Token.objects.filter(user=user).exists())
+
+    def import_users(self, rows, batch_size):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as source:
+            source.write("\n".join(json.dumps(row) for row in rows))
+            source.flush()
+            output = io.StringIO()
+            call_command(
+                "import_users", source.name, "--workers", "1", "--batch-size", str(batch_size), stdout=output
+            )
+        return output.getvalue()
+
+    def test_import_resumes_past_batches_without_new_users(self):
+        rows = [{"username": "user{}".format(i), "password": "secret"} for i in range(6)]
+        self.import_users(rows[:2], batch_size=2)
+
+        output = self.import_users(rows, batch_size=2)
+        self.assertIn("6 rows read, 4 created, 2 existing, 0 invalid", output)
+        self.assertEqual(User.objects.count(), 6)
+
+        output = self.import_users(rows, batch_size=2)
+        self.assertIn("6 rows read, 0 created, 6 existing, 0 invalid", output)
+
+    def test_batch_without_new_users_in_the_middle(self):
+        rows = [
+            {"username": "first", "password": "secret"},
+            {"username": "first", "password": "secret"},
+            {"username": 1},
+            {"username": "last", "password": "secret"},
+        ]
+        output = self.import_users(rows, batch_size=1)
+        self.assertIn("4 rows read, 2 created, 1 existing, 1 invalid", output)
+        self.assertEqual(set(User.objects.values_list("username", flat=True)), {"first", "last"})
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="player", password="secret")
+        self.token = Token.objects.create(user=self.user)
+
+    def login(self, password):
+        return self.client.post("/api/authenticate/", {"username": "player", "password": password})
+
+    def test_login_returns_token_and_user(self):
+        response = self.login("secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["token"], self.token.key)
+        self.assertEqual(response.json()["user"]["username"], "player")
+
+    def test_failures_go_through_authenticate(self):
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials["username"])
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        self.assertEqual(self.login("wrong").status_code, 400)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login("secret").status_code, 400)
+        self.assertEqual(failures, ["player", "player"])
+
+    def test_outdated_hash_is_upgraded(self):
+        hasher = PBKDF2PasswordHasher()
+        outdated = hasher.encode("secret", hasher.salt(), iterations=1000)
+        User.objects.filter(pk=self.user.pk).update(password=outdated)
+
+        self.assertEqual(self.login("secret").status_code, 200)
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, outdated)
+        self.assertTrue(self.user.check_password("secret"))
+
+    def test_saturated_verifier(self):
+        taken = 0
+        while password_verifier._slots.acquire(blocking=False):
+            taken += 1
+        for _ in range(taken):
+            self.addCleanup(password_verifier._slots.release)
+
+        self.assertEqual(self.login("secret").status_code, 429)
+        # outside the API the login is refused instead of raising
+        self.assertIsNone(authenticate(username="player", password="secret"))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name="g", location="loc", description="desc")
+        self.admin = User.objects.create_user(username="admin")
+        self.player = User.objects.create_user(username="@player")
+        Member.objects.create(group=self.group, user=self.admin, admin=True)
+        Member.objects.create(group=self.group, user=self.player)
+        now = timezone.now()
+        self.played = Event.objects.create(
+            team1="=SUM(A1)", team2="b", time=now - timedelta(days=1), group=self.group
+        )
+        self.upcoming = Event.objects.create(team1="c", team2="d", time=now + timedelta(days=1), group=self.group)
+        for event in (self.played, self.upcoming):
+            for user in (self.admin, self.player):
+                Bet.objects.create(event=event, user=user, score1=1, score2=0)
+
+    def export(self, user, query=""):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get("/api/groups/{}/export/{}".format(self.group.id, query))
+
+    def test_csv_hides_upcoming_bets_and_escapes_formulas(self):
+        response = self.export(self.admin)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        header, *rows = csv.reader(io.StringIO(b"".join(response.streaming_content).decode()))
+
+        self.assertEqual(header[:2], ["event", "team1"])
+        self.assertEqual([row[0] for row in rows], [str(self.played.id)] * 2 + [str(self.upcoming.id)])
+        self.assertEqual(rows[0][1], "'=SUM(A1)")
+        self.assertEqual({row[7] for row in rows[:2]}, {"admin", "'@player"})
+        self.assertEqual(rows[2][6:], [""] * 6)
+
+    def test_gzipped_ndjson_for_staff_includes_upcoming_bets(self):
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        response = self.export(staff, "?as=ndjson&gzip=1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]["team1"], "=SUM(A1)")
+        self.assertEqual({row["username"] for row in rows if row["event"] == self.upcoming.id}, {"admin", "@player"})
+
+    def test_placed_at_survives_scoring(self):
+        placed_at = self.played.time - timedelta(hours=1)
+        Bet.objects.filter(event=self.played).update(placed_at=placed_at)
+        record_result(self.played, 2, 1)
+        self.assertTrue(Bet.objects.filter(event=self.played, updated_at__gt=self.played.time).exists())
+
+        response = self.export(self.admin, "?as=ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        played = [row for row in rows if row["event"] == self.played.id]
+        self.assertEqual([row["result1"] for row in played], [2, 2])
+        self.assertEqual({row["placed_at"] for row in played}, {format_datetime(placed_at)})
+
+    def test_members_get_403_and_unknown_formats_400(self):
+        self.assertEqual(self.export(self.player).status_code, 403)
+        self.assertEqual(self.export(self.admin, "?as=xml").status_code, 400)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.user = User.objects.create_user(username="player")
+        UserProfile.objects.create(user=self.user, bio="old bio")
+        self.group = Group.objects.create(name="g", location="loc", description="desc")
+        Member.objects.create(group=self.group, user=self.user)
+        self.event = Event.objects.create(
+            team1="a", team2="b", time=timezone.now() - timedelta(hours=1), group=self.group
+        )
+        Bet.objects.create(event=self.event, user=self.user, score1=1, score2=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.group_url = "/api/groups/{}/".format(self.group.id)
+        self.event_url = "/api/events/{}/".format(self.event.id)
+
+    def test_event_detail_queries_do_not_grow_with_bets(self):
+        later = Event.objects.create(
+            team1="c", team2="d", time=timezone.now() + timedelta(hours=1), group=self.group
+        )
+        for i in range(5):
+            user = User.objects.create_user(username="better{}".format(i))
+            UserProfile.objects.create(user=user, bio="bio")
+            Member.objects.create(group=self.group, user=user)
+            Bet.objects.create(event=self.event, user=user, score1=i, score2=0)
+            Bet.objects.create(event=later, user=user, score1=i, score2=0)
+        Bet.objects.create(event=later, user=self.user, score1=0, score2=0)
+
+        for url, bets in ((self.event_url, 6), ("/api/events/{}/".format(later.id), 1)):
+            # the cache version check, the event with its bet count and admin flag,
+            # the bets with their users and profiles
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(len(response.json()["bets"]), bets)
+
+    def test_etag_gives_304_until_a_shown_user_changes(self):
+        group_etag = self.client.get(self.group_url)["ETag"]
+        event_etag = self.client.get(self.event_url)["ETag"]
+        self.assertEqual(self.client.get(self.group_url, HTTP_IF_NONE_MATCH=group_etag).status_code, 304)
+        self.assertEqual(self.client.get(self.event_url, HTTP_IF_NONE_MATCH=event_etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "renamed"
+            self.user.save()
+        response = self.client.get(self.group_url, HTTP_IF_NONE_MATCH=group_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["members"][0]["user"]["username"], "renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.user.profile
+            profile.bio = "new bio"
+            profile.save()
+        response = self.client.get(self.event_url, HTTP_IF_NONE_MATCH=event_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bets"][0]["user"]["profile"]["bio"], "new bio")
+
+    def test_unrelated_user_saves_keep_the_version(self):
+        etag = self.client.get(self.group_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=["last_login"])
+        self.assertEqual(self.client.get(self.group_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_missing_rows_store_no_version(self):
+        self.assertEqual(self.client.get("/api/groups/999999/").status_code, 404)
+        self.assertEqual(self.client.get("/api/events/999999/").status_code, 404)
+        self.assertEqual(self.client.get("/api/events/nope/").status_code, 404)
+        keys = ["bwf:version:group:999999", "bwf:version:event:999999", "bwf:version:event:nope"]
+        self.assertEqual(response_cache.get_cache().get_many(keys), {})
+
+
+class PlaceBetsTests(TestCase):
+    def test_statuses_per_item(self):
+        user = User.objects.create_user(username="better")
+        group = Group.objects.create(name="g", location="loc", description="desc")
+        other = Group.objects.create(name="other", location="loc", description="desc")
+        Member.objects.create(group=group, user=user)
+        now = timezone.now()
+        upcoming = Event.objects.create(team1="a", team2="b", time=now + timedelta(days=1), group=group)
+        bet_on = Event.objects.create(team1="c", team2="d", time=now + timedelta(days=1), group=group)
+        started = Event.objects.create(team1="e", team2="f", time=now - timedelta(hours=1), group=group)
+        foreign = Event.objects.create(team1="g", team2="h", time=now + timedelta(days=1), group=other)
+        Bet.objects.create(event=bet_on, user=user, score1=0, score2=0)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post("/api/bets/place_bets/", {"bets": [
+            {"event": upcoming.id, "score1": 1, "score2": 1},
+            {"event": upcoming.id, "score1": 2, "score2": 1},
+            {"event": bet_on.id, "score1": 3, "score2": 0},
+            {"event": started.id, "score1": 1, "score2": 0},
+            {"event": foreign.id, "score1": 1, "score2": 0},
+            {"event": 999999, "score1": 1, "score2": 0},
+            {"event": upcoming.id, "score1": "x", "score2": 0},
+        ]}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "2 of 7 bets placed")
+        self.assertEqual([result["status"] for result in response.json()["results"]], [
+            "superseded", "created", "updated", "too_late", "not_member", "not_found", "invalid",
+        ])
+        self.assertEqual(
+            set(Bet.objects.filter(user=user).values_list("event", "score1", "score2")),
+            {(upcoming.id, 2, 1), (bet_on.id, 3, 0)},
+        )
+
+
+class ServeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, SERVE_ACCEL_REDIRECT=False))
+        self.body = bytes(range(256)) * 4
+        with open(os.path.join(media_root, "file.bin"), "wb") as file:
+            file.write(self.body)
+
+    def get(self, **headers):
+        request = RequestFactory().get("/media/file.bin", **headers)
+        return serve.serve(request, "file.bin", "media")
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_byte_range(self):
+        response = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(self.content(response), self.body[10:20])
+
+    def test_suffix_range(self):
+        response = self.get(HTTP_RANGE="bytes=-100")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 924-1023/1024")
+        self.assertEqual(self.content(response), self.body[-100:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE="bytes=2000-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_not_modified_and_stale_if_range(self):
+        full = self.get()
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(self.content(full), self.body)
+        full.close()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=full["ETag"]).status_code, 304)
+        stale = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        stale.close()
+
+
+class BrokerTests(TestCase):
+    def test_publish_on_commit_delivers_after_the_commit(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        test_broker = Broker(queue_size=2)
+
+        async def subscribe():
+            return test_broker.subscribe(1)
+
+        subscription = loop.run_until_complete(subscribe())
+        other = loop.run_until_complete(subscribe())
+        with self.captureOnCommitCallbacks() as callbacks:
+            test_broker.publish_on_commit(1, "event_scored", {"event": 5})
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(subscription.queue.empty())
+
+        for callback in callbacks:
+            callback()
+        test_broker.publish(2, "event_scored", {"event": 6})
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(subscription.queue.get_nowait(), b'event: event_scored\ndata: {"event": 5}\n\n')
+        self.assertTrue(subscription.queue.empty())
+
+        test_broker.unsubscribe(subscription)
+        test_broker.unsubscribe(other)
+        self.assertEqual(dict(test_broker._subscriptions), {})
+
+    async def test_stream_ticket_is_single_use_and_closing_unsubscribes(self):
+        user = await User.objects.acreate(username="watcher")
+        group = await Group.objects.acreate(name="g", location="loc", description="desc")
+        client = APIClient()
+        client.force_authenticate(user)
+        response = await sync_to_async(client.post)("/api/groups/{}/stream_ticket/".format(group.id))
+        url = "/api/groups/{}/stream/?ticket={}".format(group.id, response.json()["ticket"])
+
+        response = await AsyncClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b"retry: 3000\n\n")
+        self.assertIn(group.id, broker._subscriptions)
+        # what the ASGI handler does when the client goes away
+        await content.aclose()
+        await sync_to_async(response.close)()
+        self.assertNotIn(group.id, broker._subscriptions)
+
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+
+
+# every async view switched on under /api/, the viewsets alone under /sync/
+urlpatterns = [
+    path("api/", include(async_views.urlpatterns(dict.fromkeys(async_views.ENDPOINTS, True)) + api_urls.urlpatterns)),
+    path("sync/", include(api_urls.urlpatterns)),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="player")
+        self.token = Token.objects.create(user=self.user)
+        self.other = User.objects.create_user(username="other")
+        self.groups = [Group.objects.create(name=name, location="loc", description="desc") for name in "abcde"]
+        Member.objects.create(group=self.groups[0], user=self.user, admin=True)
+        Member.objects.create(group=self.groups[0], user=self.other)
+        now = timezone.now()
+        # ties on time, the cursors have to carry an offset
+        for minutes in (3, 2, 2, 2, 1):
+            Comment.objects.create(
+                user=self.user, group=self.groups[0], description="c", time=now - timedelta(minutes=minutes)
+            )
+        self.event = Event.objects.create(team1="a", team2="b", time=now + timedelta(days=1), group=self.groups[0])
+        Bet.objects.create(event=self.event, user=self.user, score1=1, score2=0)
+        Bet.objects.create(event=self.event, user=self.other, score1=0, score2=0)
+        self.headers = {"Authorization": "Token " + self.token.key}
+
+    def get(self, url):
+        return AsyncClient().get(url, headers=self.headers)
+
+    def sync_get(self, url):
+        return sync_to_async(self.client.get)(url, headers=self.headers)
+
+    async def follow(self, url):
+        results = []
+        while url:
+            response = await self.get(url)
+            self.assertEqual(response.status_code, 200)
+            results += response.json()["results"]
+            url = response.json()["next"]
+        return results
+
+    async def test_lists_match_the_viewsets(self):
+        for route in ("groups/", "comments/"):
+            sync_response = await self.sync_get("/sync/" + route + "?page_size=50")
+            expected = sync_response.json()["results"]
+            self.assertEqual(len(expected), 5)
+            self.assertEqual(await self.follow("/api/" + route + "?page_size=2"), expected)
+
+    async def test_cursors_work_on_both_routes(self):
+        for route in ("groups/", "comments/"):
+            first = (await self.get("/api/" + route + "?page_size=2")).json()
+            cursor = first["next"].split("?", 1)[1]
+            async_page = (await self.get("/api/" + route + "?" + cursor)).json()
+            sync_page = (await self.sync_get("/sync/" + route + "?" + cursor)).json()
+            self.assertEqual(async_page["results"], sync_page["results"])
+
+            # a previous link is a reversed cursor, the viewset pages it
+            previous = (await self.get(async_page["previous"])).json()
+            self.assertEqual(previous["results"], first["results"])
+
+    async def test_invalid_cursor(self):
+        self.assertEqual((await self.get("/api/comments/?cursor=garbage")).status_code, 404)
+
+    async def test_fields(self):
+        response = await self.get("/api/groups/?fields=id")
+        self.assertEqual(response.json()["results"][0], {"id": self.groups[0].id})
+        response = await self.get("/api/events/{}/?fields=id,num_bets".format(self.event.id))
+        self.assertEqual(response.json(), {"id": self.event.id, "num_bets": 2})
+
+    async def test_permissions(self):
+        self.assertEqual((await AsyncClient().get("/api/groups/")).status_code, 200)
+        self.assertEqual((await AsyncClient().get("/api/comments/")).status_code, 401)
+        url = "/api/events/{}/".format(self.event.id)
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+        bad_token = {"Authorization": "Token nope"}
+        self.assertEqual((await AsyncClient().get(url, headers=bad_token)).status_code, 401)
+        self.assertEqual((await self.get("/api/events/0/")).status_code, 404)
+
+        # before kickoff only the own bet is visible
+        event = (await self.get(url)).json()
+        self.assertTrue(event["is_admin"])
+        self.assertEqual([bet["user"]["id"] for bet in event["bets"]], [self.user.id])
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        groups = [Group.objects.create(name=name, location="loc", description="desc") for name in "ab"]
+        # totals over both groups: 9, 7, 7, 5, 3, 1
+        self.users = []
+        for index, (first, second) in enumerate([(4, 5), (7, 0), (3, 4), (5, 0), (1, 2), (1, 0)]):
+            user = User.objects.create_user(username="p{}".format(index))
+            Standing.objects.create(group=groups[0], user=user, points=first)
+            Standing.objects.create(group=groups[1], user=user, points=second)
+            self.users.append(user)
+        self.outsider = User.objects.create_user(username="outsider")
+        self.assertEqual(leaderboard.refresh(), 6)
+
+    def get(self, user, query=""):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get("/api/leaderboard/" + query)
+
+    def test_top_entries_share_ranks_on_ties(self):
+        data = self.get(self.users[0], "?limit=4").json()
+        rows = [(row["user"]["username"], row["points"], row["rank"], row["position"]) for row in data["results"]]
+        self.assertEqual(rows, [("p0", 9, 1, 1), ("p1", 7, 2, 2), ("p2", 7, 2, 3), ("p3", 5, 4, 4)])
+        self.assertEqual(data["me"]["position"], 1)
+        self.assertIsNotNone(data["refreshed_at"])
+
+    def test_around_me(self):
+        data = self.get(self.users[4], "?around=me&limit=3").json()
+        self.assertEqual([row["position"] for row in data["results"]], [4, 5, 6])
+        self.assertEqual(data["me"]["user"]["username"], "p4")
+
+        data = self.get(self.outsider, "?around=me").json()
+        self.assertEqual((data["me"], data["results"]), (None, []))
+
+    @override_settings(API_LEADERBOARD_MAX_LIMIT=3)
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.get(self.users[0], "?limit=1000").json()["results"]), 3)
+        self.assertEqual(len(self.get(self.users[0], "?limit=0").json()["results"]), 1)
+
+    def test_bad_params_get_400(self):
+        self.assertEqual(self.get(self.users[0], "?limit=ten").status_code, 400)
+        self.assertEqual(self.get(self.users[0], "?around=p1").status_code, 400)
+
+
+@override_settings(SQLITE_READ_REPLICAS=["replica0", "replica1"])
+class SqliteProfileTests(TransactionTestCase):
+    # not a TestCase, reads stay on default inside its transaction
+    router = ReadReplicaRouter()
+
+    def test_reads_go_to_replicas_outside_transactions(self):
+        self.assertIn(self.router.db_for_read(Bet), {"replica0", "replica1"})
+        self.assertIsNone(self.router.db_for_read(User))
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Bet), "default")
+
+    def test_writes_and_migrations_stay_on_default(self):
+        bet = Bet(user_id=1, event_id=1)
+        bet._state.db = "default"
+        self.assertEqual(self.router.db_for_read(Bet, instance=bet), "default")
+        self.assertEqual(self.router.db_for_write(Bet), "default")
+        self.assertTrue(self.router.allow_migrate("default", "api"))
+        self.assertFalse(self.router.allow_migrate("replica0", "api"))
+
+    @override_settings(SQLITE_READ_REPLICAS=[])
+    def test_nothing_is_routed_without_replicas(self):
+        self.assertIsNone(self.router.db_for_read(Bet))
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite pragmas")
+    def test_pragmas_are_applied_to_new_connections(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        default = connections["default"]
+        settings_dict = dict(default.settings_dict, NAME=os.path.join(directory, "db.sqlite3"))
+        wrapper = type(default)(settings_dict, alias="pragmas")
+        self.addCleanup(wrapper.close)
+
+        with override_settings(SQLITE_PRODUCTION=True):
+            wrapper.ensure_connection()
+        with wrapper.cursor() as cursor:
+            values = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store"):
+                cursor.execute("PRAGMA {}".format(name))
+                values[name] = cursor.fetchone()[0]
+        # synchronous NORMAL is 1, temp_store MEMORY is 2
+        self.assertEqual(values, {
+            "journal_mode": "wal", "synchronous": 1, "busy_timeout": 20000, "cache_size": -65536, "temp_store": 2,
+        })
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path, include
-from api import views
+from api import views, streams, async_views
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -12,6 +13,11 @@ router.register(r'users', views.UserViewSet)
 router.register(r'profile', views.UserProfileViewSet)
 
 urlpatterns = [
+    path('groups/<int:pk>/stream/', streams.group_stream),
+    *async_views.urlpatterns(settings.API_ASYNC_VIEWS),
     path('', include(router.urls)),
     path('authenticate/', views.CustomObtainAuthToken.as_view()),
+    path('leaderboard/', views.LeaderboardView.as_view()),
+    path('stats/cache/', views.CacheStatsView.as_view()),
+    path('stats/requests/', views.RequestStatsView.as_view()),
 ]
@@ -1,18 +1,38 @@
 from django.shortcuts import render
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, Subquery
+from django.utils import timezone
 from datetime import datetime
+import csv
+import io
 import pytz
-from rest_framework import viewsets, status
+from rest_framework import exceptions, viewsets, status
+from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from api.models import Group, Event, UserProfile, Member, Comment, Bet
-from rest_framework.authentication import TokenAuthentication
+from api.models import Group, Event, UserProfile, Member, Comment, Bet, LeaderboardEntry
+from api.scoring import record_result
+from api import cache as response_cache
+from api.metrics import route_stats
+from api.sparse import SparseFieldsViewMixin
+from api import export, payloads, schedule, sparse, streams, sync
+from api.broker import broker
+from api.pagination import (
+    CursorListMixin,
+    CursorPagination,
+    CommentPagination,
+    EventPagination,
+)
+from api.authentication import CachedTokenAuthentication, password_verifier
 from rest_framework.permissions import (
     IsAuthenticated,
     AllowAny,
     IsAuthenticatedOrReadOnly,
+    IsAdminUser,
 )
 from api.serializers import (
     GroupSerializer,
@@ -28,10 +48,11 @@ from api.serializers import (
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+class UserViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
+    queryset = User.objects.select_related("profile")
     serializer_class = UserSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = CursorPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (AllowAny,)
 
     @action(
@@ -60,89 +81,240 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = CommentPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    list_values = payloads.COMMENT_VALUES
+
+    def list_row(self, row):
+        return payloads.comment(row)
+
+    def perform_create(self, serializer):
+        comment = serializer.save()
+        broker.publish_on_commit(comment.group_id, "comment_created", serializer.data)
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = CursorPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = CursorPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = queryset.annotate(members_total=Count("members"))
+        return queryset
+
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = GroupFullSerializer(
-            instance, many=False, context={"request": request}
-        )
-        return Response(serializer.data)
+        def build():
+            instance = self.get_object()
+            serializer = GroupFullSerializer(
+                instance, many=False, context={"request": request}, **sparse.parse(request.query_params)
+            )
+            return serializer.data
 
+        etag, data = response_cache.group_detail(request, kwargs["pk"], build)
+        if data is None:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data, headers={"ETag": etag})
 
-class EventViewSet(viewsets.ModelViewSet):
+    @action(methods=["GET"], detail=True, permission_classes=[IsAuthenticated])
+    def changes(self, request, pk=None):
+        group = self.get_object()
+        try:
+            since = sync.decode_cursor(request.query_params.get("since"))
+        except (ValueError, OverflowError):
+            response = {"message": "Wrong params"}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        if since != sync.EPOCH and since < sync.retention_start():
+            # deletions that old may be pruned already
+            response = {"message": "Cursor expired, sync from scratch"}
+            return Response(response, status=status.HTTP_410_GONE)
+        return Response(sync.group_changes(group, request.user, since))
+
+    @action(methods=["POST"], detail=True, permission_classes=[IsAuthenticated])
+    def stream_ticket(self, request, pk=None):
+        """Ticket for ?ticket= of the group's event stream, see api/streams.py."""
+        group = self.get_object()
+        response = {
+            "ticket": streams.issue_ticket(request.user, group.pk),
+            "expires_in": settings.API_STREAM_TICKET_TTL,
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(methods=["GET"], detail=True, permission_classes=[IsAuthenticated])
+    def export(self, request, pk=None):
+        """
+        Streams the group's events and bets for auditing, group admins only.
+        ?as=csv (default) or ndjson, ?gzip=1 compresses the stream. Bets on
+        events that have not started are left out for everyone but staff.
+        """
+        group = self.get_object()
+        is_admin = Member.objects.filter(group=group, user=request.user, admin=True).exists()
+        if not (is_admin or request.user.is_staff):
+            response = {"message": "Only group admins can export"}
+            return Response(response, status=status.HTTP_403_FORBIDDEN)
+
+        export_format = request.query_params.get("as", "csv")
+        if export_format not in export.FORMATS:
+            response = {"message": "Wrong params"}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        gzip = request.query_params.get("gzip") in ("1", "true")
+        return export.response(group, export_format, gzip, upcoming_bets=request.user.is_staff)
+
+
+class EventViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = EventPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "retrieve":
+            queryset = self.with_full_details(queryset)
+        return queryset
+
+    def with_full_details(self, queryset):
+        # everything EventFullSerializer needs, in two queries
+        user = self.request.user
+        visible_bets = Bet.objects.filter(
+            Q(event__time__lt=timezone.now()) | Q(user=user)
+        ).select_related("user__profile")
+        admin_flag = Member.objects.filter(group=OuterRef("group"), user=user)
+        return (
+            queryset.annotate(
+                bets_total=Count("bets"),
+                admin_flag=Subquery(admin_flag.values("admin")[:1]),
+            )
+            .prefetch_related(
+                Prefetch("bets", queryset=visible_bets, to_attr="visible_bets")
+            )
+        )
+
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = EventFullSerializer(
-            instance, many=False, context={"request": request}
+        def build():
+            instance = self.get_object()
+            serializer = EventFullSerializer(
+                instance, many=False, context={"request": request}
+            )
+            return instance, serializer.data
+
+        etag, data = response_cache.event_detail(
+            request, kwargs["pk"], build, EventFullSerializer.Meta.fields
         )
-        return Response(serializer.data)
+        if data is None:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        # the cached parts are shared by every ?fields=, prune the joined copy
+        data = sparse.prune(data, **sparse.parse(request.query_params))
+        return Response(data, headers={"ETag": etag})
     
     @action(detail=True,methods=["PUT"],)
     def set_result(self, request, pk=None):
         event  = self.get_object()
         if ("score1" in request.data and "score2" in request.data and event.time < datetime.now(pytz.UTC)):
-            event.score1 = request.data["score1"]
-            event.score2 = request.data["score2"]
-            event.save()
-            self.calculate_points()
+            try:
+                score1 = int(request.data["score1"])
+                score2 = int(request.data["score2"])
+            except (TypeError, ValueError):
+                response = {"message": "Wrong params"}
+                return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+            record_result(event, score1, score2)
+            broker.publish_on_commit(
+                event.group_id,
+                "event_scored",
+                {"event": event.id, "score1": score1, "score2": score2},
+            )
+            event = self.with_full_details(self.get_queryset()).get(pk=event.pk)
             serializer = EventFullSerializer(event, context={"request": request})
             return Response(serializer.data)         
 
         else:
             response = {"message": "Wrong params"}
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
-        
-    def calculate_points(self):
-        event = self.get_object()
-        bets = event.bets.all()
-        for bet in bets:
-            user_points = 0
-
-            # 3pts for exact match
-            # 1:1 bet 1:1 = 3pts
-            # 1:1 bet 2:2 = 1pts
-            # 1:2 bet 1:2 = 3pts
-            if bet.score1 == event.score1 and bet.score2 == event.score2:
-                user_points = 3
-            else:
-                score_final = event.score1 - event.score2
-                bet_final = bet.score1 - bet.score2
 
-                if ((score_final > 0 and bet_final > 0) or (score_final == 0 and bet_final == 0) or (score_final < 0 and bet_final < 0)):
-                    user_points = 1
+    @action(methods=["POST"], detail=False, url_path="import")
+    def import_schedule(self, request):
+        """
+        Creates many events for the groups the user administers, from a JSON
+        list (or {"events": [...]}) or an uploaded CSV "file" with the
+        columns group, team1, team2, time and optionally score1, score2.
+        Events that already exist are reported, not duplicated, scores of
+        started events are recorded.
+        """
+        upload = request.FILES.get("file")
+        if upload is not None:
+            try:
+                items = list(schedule.read(io.StringIO(upload.read().decode("utf-8"), newline=""), "csv"))
+            except (UnicodeDecodeError, csv.Error):
+                items = None
+        else:
+            items = request.data.get("events") if hasattr(request.data, "get") else request.data
+        if not isinstance(items, list) or not items or len(items) > settings.API_IMPORT_MAX_ROWS:
+            response = {"message": "Wrong params"}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        admin_of = self.administered_groups(request.user)
+        batch_size = settings.API_IMPORT_BATCH_SIZE
+        results = []
+        for start in range(0, len(items), batch_size):
+            results += schedule.import_batch(items[start:start + batch_size], admin_of)
+
+        created = sum(result["status"] == "created" for result in results)
+        response = {
+            "message": "{} of {} events created".format(created, len(items)),
+            "results": results,
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(methods=["POST"], detail=False)
+    def results(self, request):
+        """Sets the final scores of many events of the user's groups, scored together."""
+        items = request.data.get("results") if hasattr(request.data, "get") else request.data
+        if not isinstance(items, list) or not items or len(items) > settings.API_IMPORT_MAX_ROWS:
+            response = {"message": "Wrong params"}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        admin_of = self.administered_groups(request.user)
+        batch_size = settings.API_IMPORT_BATCH_SIZE
+        results = []
+        for start in range(0, len(items), batch_size):
+            results += schedule.enter_results(items[start:start + batch_size], admin_of)
+
+        scored = sum(result["status"] == "scored" for result in results)
+        response = {
+            "message": "{} of {} results recorded".format(scored, len(items)),
+            "results": results,
+        }
+        return Response(response, status=status.HTTP_200_OK)
 
-            bet.points = user_points
-            bet.save()
+    def administered_groups(self, user):
+        # None lets staff import into any group
+        if user.is_staff:
+            return None
+        return set(Member.objects.filter(user=user, admin=True).values_list("group_id", flat=True))
 
 
-class MemberViewSet(viewsets.ModelViewSet):
-    queryset = Member.objects.all()
+class MemberViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
+    queryset = Member.objects.select_related("user__profile")
     serializer_class = MemberSerializer
-    # authentication_classes = (TokenAuthentication,)
+    pagination_class = CursorPagination
+    # authentication_classes = (CachedTokenAuthentication,)
     # permission_classes = (IsAuthenticated,)
 
     @action(methods=["POST"], detail=False)
@@ -182,11 +354,16 @@ class MemberViewSet(viewsets.ModelViewSet):
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BetViewSet(viewsets.ModelViewSet):
-    queryset = Bet.objects.all()
+class BetViewSet(SparseFieldsViewMixin, CursorListMixin, viewsets.ModelViewSet):
+    queryset = Bet.objects.select_related("user__profile")
     serializer_class = BetSerializer
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = CursorPagination
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    list_values = payloads.BET_VALUES
+
+    def list_row(self, row):
+        return payloads.bet(row, self.request)
 
     def create(self, request, *args, **kwargs):
         response = {"message": "Method not allowed"}
@@ -204,40 +381,33 @@ class BetViewSet(viewsets.ModelViewSet):
             and "score2" in request.data
         ):
             event_id = request.data["event"]
-            event = Event.objects.get(id=event_id)
-
-            in_group = self.checkIfUserIsInGroup(event, request.user)
-
-            if event.time > datetime.now(pytz.UTC) and in_group:
-                score1 = request.data["score1"]
-                score2 = request.data["score2"]
-
-                try:
-                    # UPDATE scenario
-                    my_bet = Bet.objects.get(user=request.user, event=event)
-                    my_bet.score1 = score1
-                    my_bet.score2 = score2
-                    my_bet.save()
-                    serializer = BetSerializer(my_bet, many=False)
-                    response = {
-                        "message": "Bet Updated",
-                        "new": False,
-                        "result": serializer.data,
-                    }
-                    return Response(response, status=status.HTTP_200_OK)
-
-                except:
-                    # CREATE  scenario
-                    my_bet = Bet.objects.create(
-                        user=request.user, event=event, score1=score1, score2=score2
-                    )
-                    serializer = BetSerializer(my_bet, many=False)
-                    response = {
-                        "message": "Bet Created",
-                        "new": True,
-                        "result": serializer.data,
-                    }
-                    return Response(response, status=status.HTTP_200_OK)
+            event = self.bettable_events(request.user).filter(id=event_id).first()
+            if event is None:
+                response = {"message": "Event not found"}
+                return Response(response, status=status.HTTP_404_NOT_FOUND)
+
+            if event.time > datetime.now(pytz.UTC) and event.is_member:
+                my_bet, created = Bet.objects.update_or_create(
+                    user=request.user,
+                    event=event,
+                    defaults={
+                        "score1": request.data["score1"],
+                        "score2": request.data["score2"],
+                    },
+                )
+                # the scores stay private until kickoff
+                broker.publish_on_commit(
+                    event.group_id,
+                    "bet_placed",
+                    {"event": event.id, "user": request.user.id, "new": created},
+                )
+                serializer = BetSerializer(my_bet, many=False)
+                response = {
+                    "message": "Bet Created" if created else "Bet Updated",
+                    "new": created,
+                    "result": serializer.data,
+                }
+                return Response(response, status=status.HTTP_200_OK)
             else:
                 response = {"message": "You can't place a bet. Too late!"}
                 return Response(response, status=status.HTTP_400_BAD_REQUEST)
@@ -245,18 +415,159 @@ class BetViewSet(viewsets.ModelViewSet):
             response = {"message": "Wrong params"}
             return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
-    def checkIfUserIsInGroup(self, event, user):
+    @action(methods=["POST"], detail=False, url_path="place_bets")
+    def place_bets(self, request):
+        items = request.data.get("bets") if hasattr(request.data, "get") else request.data
+        if not isinstance(items, list) or not items:
+            response = {"message": "Wrong params"}
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+
+        # later entries for the same event win
+        results = [None] * len(items)
+        wanted = {}
+        for index, item in enumerate(items):
+            try:
+                event_id = int(item["event"])
+                scores = (int(item["score1"]), int(item["score2"]))
+            except (KeyError, TypeError, ValueError):
+                results[index] = {"event": None, "status": "invalid"}
+                continue
+            if event_id in wanted:
+                previous = wanted[event_id][0]
+                results[previous] = {"event": event_id, "status": "superseded"}
+            wanted[event_id] = (index, scores)
+
+        events = self.bettable_events(request.user).in_bulk(list(wanted))
+        now = datetime.now(pytz.UTC)
+        bets = []
+        for event_id, (index, (score1, score2)) in wanted.items():
+            event = events.get(event_id)
+            if event is None:
+                results[index] = {"event": event_id, "status": "not_found"}
+            elif not event.is_member:
+                results[index] = {"event": event_id, "status": "not_member"}
+            elif event.time <= now:
+                results[index] = {"event": event_id, "status": "too_late"}
+            else:
+                bets.append(Bet(user=request.user, event=event, score1=score1, score2=score2))
+                results[index] = {"event": event_id, "status": None}
+
+        if bets:
+            with transaction.atomic():
+                # read in the transaction, so created/updated match what the upsert did
+                existing = set(
+                    Bet.objects.select_for_update()
+                    .filter(user=request.user, event__in=[bet.event_id for bet in bets])
+                    .values_list("event_id", flat=True)
+                )
+                Bet.objects.bulk_create(
+                    bets,
+                    update_conflicts=True,
+                    unique_fields=["user", "event"],
+                    update_fields=["score1", "score2", "updated_at", "placed_at"],
+                )
+                for bet in bets:
+                    # bulk_create sends no post_save
+                    response_cache.invalidate_on_commit("event", bet.event_id)
+                    index = wanted[bet.event_id][0]
+                    results[index]["status"] = "updated" if bet.event_id in existing else "created"
+                    broker.publish_on_commit(
+                        bet.event.group_id,
+                        "bet_placed",
+                        {"event": bet.event_id, "user": request.user.id, "new": bet.event_id not in existing},
+                    )
+
+        placed = len(bets)
+        response = {
+            "message": "{} of {} bets placed".format(placed, len(items)),
+            "results": results,
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
+    def bettable_events(self, user):
+        # events annotated with whether the user may bet on them
+        membership = Member.objects.filter(user=user, group=OuterRef("group"))
+        return Event.objects.annotate(is_member=Exists(membership))
+
+
+class CacheStatsView(APIView):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(response_cache.stats())
+
+
+class RequestStatsView(APIView):
+    """Per-route averages of the requests sampled by api.middleware.MetricsMiddleware in this process."""
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(route_stats.snapshot())
+
+    def delete(self, request):
+        route_stats.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LeaderboardView(APIView):
+    """
+    Global leaderboard from the snapshot of api/leaderboard.py: the top
+    ?limit= entries, or with ?around=me the entries around the caller.
+    """
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
         try:
-            return Member.objects.get(user=user, group=event.group)
-        except:
-            return False
+            limit = int(request.query_params.get("limit", settings.API_LEADERBOARD_LIMIT))
+        except ValueError:
+            return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.API_LEADERBOARD_MAX_LIMIT))
+        around = request.query_params.get("around")
+        if around not in (None, "me"):
+            return Response({"message": "around only supports me"}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = LeaderboardEntry.objects.order_by("position").values(*payloads.LEADERBOARD_VALUES)
+        me = entries.filter(user=request.user).first()
+        if around is None:
+            rows = list(entries.filter(position__lte=limit))
+        elif me is None:
+            rows = []
+        else:
+            start = max(1, me["position"] - limit // 2)
+            rows = list(entries.filter(position__gte=start, position__lt=start + limit))
+
+        refreshed_at = (me or (rows[0] if rows else {})).get("refreshed_at")
+        return Response({
+            "refreshed_at": refreshed_at and payloads.format_datetime(refreshed_at),
+            "me": me and payloads.leaderboard_entry(me, request),
+            "results": [payloads.leaderboard_entry(row, request) for row in rows],
+        })
 
 
 class CustomObtainAuthToken(ObtainAuthToken):
+    """
+    Token login with one query for user, profile and token: authenticate()
+    goes through api.authentication.PasswordVerifierBackend, which checks
+    the password on the bounded pool of password_verifier. Logins beyond
+    its pending limit get 429.
+    """
+
     def post(self, request, *args, **kwargs):
-        response = super(CustomObtainAuthToken, self).post(request, *args, **kwargs)
-        token = Token.objects.get(key=response.data["token"])
-        user = User.objects.get(id=token.user_id)
+        serializer = self.get_serializer(data=request.data)
+        with password_verifier.reserve() as reserved:
+            if not reserved:
+                raise exceptions.Throttled(wait=1)
+            serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data["user"]
+        try:
+            token = user.auth_token
+        except Token.DoesNotExist:
+            token, _ = Token.objects.get_or_create(user=user)
         userSerializer = UserSerializer(user, many=False)
 
         return Response({"token": token.key, "user": userSerializer.data})
@@ -0,0 +1,150 @@
+"""
+Static and media files without DEBUG. Hashed static names (see
+bwf.storage) are cached as immutable, precompressed .br/.gz siblings are
+sent to clients that accept them, conditional and single range requests
+are answered here. Full responses go out as FileResponse, which WSGI
+servers hand to sendfile().
+
+With settings.SERVE_ACCEL_REDIRECT the body is left to the front proxy
+through X-Accel-Redirect, e.g. for nginx:
+
+    location /internal/static/ { internal; alias /srv/bwf/staticfiles/; }
+    location /internal/media/ { internal; alias /srv/bwf/mediafiles/; }
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+CHUNK_SIZE = 64 * 1024
+
+
+def document_root(kind):
+    return settings.STATIC_ROOT if kind == "static" else settings.MEDIA_ROOT
+
+
+def precompressed(request, fullpath):
+    accepted = request.headers.get("Accept-Encoding", "")
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return encoding, fullpath + suffix
+    return None, fullpath
+
+
+def not_modified(request, etag, mtime):
+    if "If-None-Match" in request.headers:
+        etags = parse_etags(request.headers["If-None-Match"])
+        return "*" in etags or etag in etags
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def byte_range(request, etag, size):
+    """(start, end) of a single satisfiable Range, None to send the whole file, False for 416."""
+    header = request.headers.get("Range")
+    if not header or request.headers.get("If-Range", etag) != etag:
+        return None
+    match = BYTE_RANGE.match(header.strip())
+    if match is None:
+        # several ranges or other units, the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path, kind):
+    root = document_root(kind)
+    try:
+        fullpath = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type = mimetypes.guess_type(fullpath)[0] or "application/octet-stream"
+    encoding = None
+    if kind == "static" and "Range" not in request.headers:
+        encoding, fullpath = precompressed(request, fullpath)
+
+    stat = os.stat(fullpath)
+    etag = quote_etag("{:x}-{:x}{}".format(stat.st_mtime_ns, stat.st_size, "-" + encoding if encoding else ""))
+    immutable = kind == "static" and HASHED_NAME.search(path)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": settings.SERVE_IMMUTABLE_CACHE_CONTROL if immutable else settings.SERVE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if kind == "static":
+        headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if not_modified(request, etag, stat.st_mtime):
+        return HttpResponseNotModified(headers=headers)
+
+    if settings.SERVE_ACCEL_REDIRECT:
+        # the proxy answers ranges and sends the file itself
+        relative = os.path.relpath(fullpath, root).replace(os.sep, "/")
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response["X-Accel-Redirect"] = settings.SERVE_ACCEL_PREFIXES[kind] + quote(relative)
+        return response
+
+    requested = byte_range(request, etag, stat.st_size)
+    if requested is False:
+        headers["Content-Range"] = "bytes */{}".format(stat.st_size)
+        return HttpResponse(status=416, headers=headers)
+    if requested is not None:
+        start, end = requested
+        response = StreamingHttpResponse(
+            read_range(fullpath, start, end - start + 1), status=206, content_type=content_type, headers=headers
+        )
+        response["Content-Range"] = "bytes {}-{}/{}".format(start, end, stat.st_size)
+        response["Content-Length"] = str(end - start + 1)
+        return response
+
+    return FileResponse(open(fullpath, "rb"), content_type=content_type, headers=headers)
+
+
+def urlpatterns():
+    return [
+        re_path(r"^{}(?P<path>.*)$".format(re.escape(url.lstrip("/"))), serve, {"kind": kind})
+        for kind, url in (("static", settings.STATIC_URL), ("media", settings.MEDIA_URL))
+    ]
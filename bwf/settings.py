@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -86,6 +87,128 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile: WAL and tuned pragmas on every connection plus
+# read-only replica connections for the api models, see api/db.py
+SQLITE_PRODUCTION = os.environ.get('BWF_SQLITE_PRODUCTION') == '1'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_READ_REPLICAS = []
+
+if SQLITE_PRODUCTION:
+    DATABASES['default']['OPTIONS'] = {
+        # take the write lock when the transaction starts, concurrent
+        # writers then wait on the busy timeout instead of failing
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    }
+    DATABASES['default']['TEST'] = {
+        # in-memory test databases lock whole tables between threads
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    }
+    for index in range(int(os.environ.get('BWF_SQLITE_READ_REPLICAS', '2'))):
+        alias = 'replica{}'.format(index)
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'file:{}?mode=ro'.format(DATABASES['default']['NAME']),
+            'TEST': {'MIRROR': 'default'},
+        }
+        SQLITE_READ_REPLICAS.append(alias)
+    DATABASE_ROUTERS = ['api.db.ReadReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.environ.get('BWF_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['BWF_REDIS_URL'],
+    }
+
+# Response cache of the group and event detail endpoints, see api/cache.py
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# In-process token -> user cache of api.authentication.CachedTokenAuthentication,
+# entries are checked against a per-token version in the API_CACHE_ALIAS cache,
+# which has to be shared by all workers (Redis) for revocations to reach them
+API_TOKEN_CACHE_SIZE = 10000
+API_TOKEN_CACHE_TTL = 60
+
+# Password checks of authenticate() run on this many threads, see
+# api.authentication.PasswordVerifierBackend, logins beyond
+# API_LOGIN_MAX_PENDING waiting checks get 429
+AUTHENTICATION_BACKENDS = ['api.authentication.PasswordVerifierBackend']
+API_LOGIN_WORKERS = 4
+API_LOGIN_MAX_PENDING = 64
+
+# Server-Sent Events of /api/groups/<id>/stream/, see api/broker.py
+API_STREAM_QUEUE_SIZE = 100
+API_STREAM_KEEPALIVE = 15
+API_STREAM_RETRY_MS = 3000
+# lifetime of the single-use ?ticket= of a stream, tokens stay out of URLs
+API_STREAM_TICKET_TTL = 30
+
+# GET endpoints served by the async views of api/async_views.py instead
+# of the DRF viewsets, only worth it under ASGI (bwf/asgi.py)
+API_ASYNC_VIEWS = {
+    'group-list': False,
+    'group-detail': False,
+    'event-detail': False,
+    'comment-list': False,
+}
+
+# Seconds a delta sync cursor is moved back to catch late commits, see api/sync.py
+API_SYNC_OVERLAP = 5
+
+# Days deletions are kept for the delta sync. manage.py prune_tombstones
+# drops older tombstones (run it daily), cursors older than this get 410 and
+# the client has to sync from scratch
+API_SYNC_TOMBSTONE_DAYS = 30
+
+# Avatar variants of api/avatars.py, built on API_AVATAR_WORKERS background
+# threads after an upload commits, 0 builds them inline
+API_AVATAR_SIZES = (64, 128, 256)
+API_AVATAR_FORMAT = 'WEBP'
+API_AVATAR_QUALITY = 80
+API_AVATAR_WORKERS = 2
+
+# Request instrumentation of api/middleware.py: share of requests measured
+# and the thresholds above which requests and queries are logged as slow
+API_METRICS_SAMPLE_RATE = float(os.environ.get('BWF_METRICS_SAMPLE_RATE', '0.1'))
+API_METRICS_SLOW_REQUEST_MS = 500
+API_METRICS_SLOW_QUERY_MS = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # INFO adds one JSON line per sampled request
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': os.environ.get('BWF_METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,11 +249,48 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = 'mediafiles/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # hashed names and .gz/.br siblings, written by collectstatic
+    'staticfiles': {
+        'BACKEND': 'bwf.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# File serving of bwf/serve.py. SERVE_ACCEL_REDIRECT hands the body to the
+# front proxy, which maps SERVE_ACCEL_PREFIXES to STATIC_ROOT and MEDIA_ROOT
+SERVE_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+SERVE_CACHE_CONTROL = 'public, max-age=300'
+SERVE_ACCEL_REDIRECT = os.environ.get('BWF_ACCEL_REDIRECT') == '1'
+SERVE_ACCEL_PREFIXES = {
+    'static': '/internal/static/',
+    'media': '/internal/media/',
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Rows fetched per query by the streaming group export, see api/export.py
+API_EXPORT_CHUNK_SIZE = 2000
+
+# Rows per transaction of the bulk event import and result entry, and the
+# most rows one request may send, see api/schedule.py
+API_IMPORT_BATCH_SIZE = 500
+API_IMPORT_MAX_ROWS = 10000
+
+# Default and largest window of /api/leaderboard/, see api/leaderboard.py
+API_LEADERBOARD_LIMIT = 50
+API_LEADERBOARD_MAX_LIMIT = 200
+
+# Cursor pagination of the api list endpoints, see api/pagination.py
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_STREAM_THRESHOLD = 200
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
     'http://127.0.0.1:3000',
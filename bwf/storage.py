@@ -0,0 +1,41 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed file names plus precompressed .gz (and .br with the brotli
+    package installed) siblings of the text files, written by collectstatic
+    and picked by bwf.serve according to Accept-Encoding.
+    """
+
+    compress_extensions = (".css", ".js", ".map", ".svg", ".json", ".txt", ".html", ".xml", ".ico", ".ttf", ".otf")
+    # siblings that save less than this are not worth a second file
+    min_saving = 0.05
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not dry_run and hashed_name and not isinstance(processed, Exception):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        if not name.endswith(self.compress_extensions):
+            return
+        path = self.path(name)
+        with open(path, "rb") as source:
+            data = source.read()
+        self.write_sibling(path + ".gz", data, gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self.write_sibling(path + ".br", data, brotli.compress(data, quality=11))
+
+    def write_sibling(self, path, data, compressed):
+        if len(compressed) <= len(data) * (1 - self.min_saving):
+            with open(path, "wb") as target:
+                target.write(compressed)